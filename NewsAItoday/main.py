@@ -1,29 +1,36 @@
 import feedparser
 from newspaper import Article
-import time
 from virtworker import *
+from virtworker import fetch
 import random
 
+configure_logging()
+
 def fetch_news(rss_url, max_articles=5):
-    all_articles = []
+    all_articles = {}
     feed = feedparser.parse(rss_url)
-    
-    for entry in feed.entries[:max_articles]:
-        article = Article(entry.link)
+    links = [entry.link for entry in feed.entries[:max_articles]]
+
+    # Download all articles at once; the fetcher limits requests per host and spaces them out
+    for result in fetch.get_fetcher().fetch_many(links, per_host=2, host_delay=1.0):
+        link = result.source
+        if not result.ok:
+            print(f"Error processing article {link}: {str(result.error)}")
+            continue
+        article = Article(link)
         try:
-            article.download()
+            article.download(input_html=result.value.text)
             article.parse()
             article.nlp()
-            all_articles.append({
+            all_articles[result.index] = {
                 'title': article.title,
                 'text': article.text,
-                'url': entry.link,
-            })
-            time.sleep(1)
+                'url': link,
+            }
         except Exception as e:
-            print(f"Error processing article {entry.link}: {str(e)}")
-    
-    return all_articles
+            print(f"Error processing article {link}: {str(e)}")
+
+    return [all_articles[index] for index in sorted(all_articles)]
 
 summarizer = create_node("llama3.1:8b", "Summarizer", max_tokens=16384)
 summarizer.definition = "Summarize the given news article concisely and humorously in one sentence."
@@ -40,14 +47,17 @@ def generate_late_night_content(rss_url):
     
     content.append("<host>Hello, humans! I'm Circuit Colbert, your AI late-night host. Let's dive into tonight's news!</host>")
     
-    for article in news_articles:
+    # Articles are independent, so run each stage over all of them at once
+    summaries = [r.output if r.ok else "" for r in summarizer.map([a['text'] for a in news_articles])]
+    jokes = [r.output if r.ok else "" for r in joke_writer.map(summaries)]
+    monologues = monologue_generator.map([f"{summary}\n{joke}" for summary, joke in zip(summaries, jokes)])
+
+    for article, monologue in zip(news_articles, monologues):
         content.append(f"<onscreen>Headline: {article['title']}</onscreen>")
-        
-        summary = summarizer(article['text'])
-        joke = joke_writer(summary)
-        monologue = monologue_generator(f"{summary}\n{joke}")
-        
-        content.append(f"<host>{monologue}</host>")
+        if monologue.ok:
+            content.append(f"<host>{monologue.output}</host>")
+        else:
+            print(f"Skipping monologue for {article['url']}: {monologue.error}")
     
     content.append("<host>That's all for tonight, folks! Remember, I may be artificial, but my love for you is real... or is it just a well-trained language model? You decide! Goodnight!</host>")
     
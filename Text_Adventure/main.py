@@ -184,6 +184,8 @@ def game_loop(stdscr, story_node, summarizer_node):
 def main():
     try:
         nodes = create_nodes()
+        nodes['story'].context_mode = "summarize"
+        nodes['story'].reuse_kv = True
         stdscr = init_curses()
         game_loop(stdscr, nodes['story'], nodes['summarizer'])
     except Exception as e:
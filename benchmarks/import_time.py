@@ -0,0 +1,44 @@
+"""Measure how long ``import virtworker`` takes in a fresh interpreter.
+
+Usage: python benchmarks/import_time.py [--runs N] [--statement "..."]
+
+Each run starts a new Python process so module caches never carry over. The
+default statement also creates a node, which is what most scripts do first.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_statement(statement, runs):
+    timer = ("import time; start = time.perf_counter(); "
+             f"{statement}; "
+             "print(time.perf_counter() - start)")
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", timer], cwd=REPO_ROOT, check=True,
+                                capture_output=True, text=True).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--statement", default="import virtworker; virtworker.create_node('llama3.1:8b', 'Bench')")
+    args = parser.parse_args()
+
+    samples = time_statement(args.statement, args.runs)
+    print(f"{args.statement}")
+    print(f"  runs:   {len(samples)}")
+    print(f"  median: {statistics.median(samples) * 1000:.1f} ms")
+    print(f"  min:    {min(samples) * 1000:.1f} ms")
+    print(f"  max:    {max(samples) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
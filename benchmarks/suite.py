@@ -0,0 +1,351 @@
+"""Benchmark virtworker against the fake Ollama server.
+
+Usage:
+    python benchmarks/suite.py [--only NAME ...] [--quick] [--save PATH] [--compare BASELINE]
+
+Every benchmark runs against ``virtworker.fakeserver`` so the numbers show
+virtworker's own overhead and concurrency, not model speed. Results are
+written as JSON (by default to benchmarks/results/latest.json). Pass a
+previous result file with ``--compare`` to list metrics that got worse by
+more than ``--threshold``; the exit status is 1 when any did.
+
+Metrics ending in ``_per_s`` are better when higher, all others (seconds,
+milliseconds) when lower.
+"""
+import argparse
+import asyncio
+import datetime
+import glob
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import requests  # noqa: E402
+
+import virtworker  # noqa: E402
+from virtworker.fakeserver import FakeOllama  # noqa: E402
+
+MODEL = "llama3"
+DEFAULT_OUTPUT = os.path.join(REPO_ROOT, "benchmarks", "results", "latest.json")
+FIXTURES = os.path.join(REPO_ROOT, "benchmarks", "fixtures")
+
+
+def measure(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def ms(seconds):
+    return round(seconds * 1000, 4)
+
+
+def summary_ms(prefix, samples):
+    samples = sorted(samples)
+    return {
+        f"{prefix}_median_ms": ms(statistics.median(samples)),
+        f"{prefix}_p95_ms": ms(samples[min(len(samples) - 1, int(len(samples) * 0.95))]),
+    }
+
+
+def fresh_node(name, server, **attributes):
+    node = virtworker.create_node(MODEL, name)
+    node.transport = virtworker.get_transport(server.url)
+    node.definition = "You are a benchmark node."
+    for key, value in attributes.items():
+        setattr(node, key, value)
+    return node
+
+
+def bench_call_overhead(args):
+    """Time a node call minus a bare HTTP request for the same body on an instant backend."""
+    repeat = 50 if args.quick else 300
+    with FakeOllama(ttft=0, tokens_per_second=0, response_tokens=8) as server:
+        node = fresh_node("overhead", server)
+        body = node._request_body(node._build_prompt("ping", context=[]), 64, stream=False)
+        session = requests.Session()
+        session.post(f"{server.url}/api/generate", json=body).json()
+        raw = measure(lambda: session.post(f"{server.url}/api/generate", json=body).json(), repeat)
+
+        def call():
+            node("ping")
+            node.clear_context()
+
+        call()
+        calls = measure(call, repeat)
+        session.close()
+    result = summary_ms("raw_http", raw)
+    result.update(summary_ms("node_call", calls))
+    result["overhead_median_ms"] = round(result["node_call_median_ms"] - result["raw_http_median_ms"], 4)
+    return result
+
+
+def bench_prompt_render(args):
+    """Render the next prompt with a growing context, incrementally and from scratch."""
+    sizes = (10, 100, 500) if args.quick else (10, 100, 1000, 5000)
+    result = {}
+    node = virtworker.create_node(MODEL, "render")
+    node.definition = "You are a storyteller. " * 20
+    node.max_context_length = None
+    turn = "A sentence of a fairly ordinary length that stands in for a real turn. " * 4
+    for size in sizes:
+        node.clear_context()
+        for i in range(size):
+            node._finish(f"{turn} {i}", turn)
+        node._build_prompt("next")
+        incremental = []
+        for i in range(20):
+            node._finish(f"{turn} extra {i}", turn)
+            start = time.perf_counter()
+            node._build_prompt("next")
+            incremental.append(time.perf_counter() - start)
+        full = measure(lambda: node.prompt_template.render(node.definition, node.context, "next"), 5)
+        result[f"turns_{size}_incremental_ms"] = ms(statistics.median(incremental))
+        result[f"turns_{size}_full_ms"] = ms(statistics.median(full))
+    return result
+
+
+def bench_throughput(args):
+    """Items per second through map and asyncio.gather against a server with parallel slots."""
+    items = 16 if args.quick else 48
+    result = {}
+    with FakeOllama(ttft=0.05, tokens_per_second=400, response_tokens=20, parallel=8) as server:
+        node = fresh_node("throughput", server)
+        inputs = [f"item {i}" for i in range(items)]
+        for concurrency in (1, 8):
+            start = time.perf_counter()
+            node.map(inputs, concurrency=concurrency)
+            result[f"map_concurrency_{concurrency}_per_s"] = round(items / (time.perf_counter() - start), 3)
+
+        async def gather():
+            nodes = [fresh_node(f"async {i}", server) for i in range(items)]
+            await asyncio.gather(*(n.acall(text) for n, text in zip(nodes, inputs)))
+            await virtworker.aio.close_session()
+
+        start = time.perf_counter()
+        asyncio.run(gather())
+        result["acall_gather_per_s"] = round(items / (time.perf_counter() - start), 3)
+        result["server_max_active"] = server.max_active
+    return result
+
+
+def bench_cache_hit(args):
+    """Latency of a cached response from memory and from the SQLite store."""
+    repeat = 200 if args.quick else 2000
+    result = {}
+    with FakeOllama(ttft=0, tokens_per_second=0) as server, tempfile.TemporaryDirectory() as tmp:
+        for label, cache in (("memory", virtworker.ResponseCache()),
+                             ("disk", virtworker.ResponseCache(max_memory_entries=1, path=os.path.join(tmp, "c.db")))):
+            node = fresh_node(f"cache {label}", server, cache=cache)
+            prompt = node._build_prompt("cached question", context=[])
+            other = node._build_prompt("other question", context=[])
+            node._generate(prompt, 64)
+            node._generate(other, 64)
+            if label == "disk":
+                # Alternate prompts so every lookup misses the one-entry memory tier
+                prompts = [prompt, other]
+                samples = [s for i in range(repeat // 2)
+                           for s in measure(lambda: node._generate(prompts[i % 2], 64), 1)]
+            else:
+                samples = measure(lambda: node._generate(prompt, 64), repeat)
+            result.update(summary_ms(label, samples))
+            cache.close()
+    return result
+
+
+def html_fixture(paragraphs):
+    """A deterministic page with navigation, scripts and article text, like a news site."""
+    parts = ["<!DOCTYPE html><html><head><title>Fixture</title>",
+             "<style>body { font-family: sans-serif; } .nav a { margin: 4px; }</style>",
+             "<script>window.analytics = {track: function () { return 1; }};</script></head><body>",
+             "<div class='nav'>" + "".join(f"<a href='/section/{i}'>Section {i}</a>" for i in range(40)) + "</div>",
+             "<article><h1>Benchmark article</h1>"]
+    for i in range(paragraphs):
+        parts.append(f"<p>Paragraph {i} of the article, with <a href='/link/{i}'>a link</a>, "
+                     f"<em>some emphasis</em> and enough plain text to look like a real sentence.</p>")
+        if i % 25 == 0:
+            parts.append("<aside class='ad'><script>render_ad();</script>Advertisement</aside>")
+    parts.append("</article><footer>" + " | ".join(f"Footer link {i}" for i in range(30)) + "</footer></body></html>")
+    return "".join(parts)
+
+
+def bench_website_text(args):
+    """Fetch and extract text from large pages served locally."""
+    sizes = (500, 5000) if args.quick else (500, 5000, 20000)
+    result = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for paragraphs in sizes:
+            with open(os.path.join(tmp, f"page_{paragraphs}.html"), "w") as f:
+                f.write(html_fixture(paragraphs))
+
+        handler = type("Handler", (SimpleHTTPRequestHandler,), {
+            "log_message": lambda self, *a: None,
+            "__init__": lambda self, *a, **kw: SimpleHTTPRequestHandler.__init__(self, *a, directory=tmp, **kw),
+        })
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        # Full downloads every time, and nothing written to the user's fetch cache
+        virtworker.fetch.set_fetcher(virtworker.Fetcher())
+        try:
+            for paragraphs in sizes:
+                url = f"http://127.0.0.1:{httpd.server_address[1]}/page_{paragraphs}.html"
+                size = os.path.getsize(os.path.join(tmp, f"page_{paragraphs}.html"))
+                samples = measure(lambda: virtworker.Website(url).text, 3)
+                result[f"kb_{size // 1024}_median_ms"] = ms(statistics.median(samples))
+        finally:
+            virtworker.fetch.set_fetcher(None)
+            httpd.shutdown()
+            httpd.server_close()
+    return result
+
+
+def bench_extract(args):
+    """The article extractor against BeautifulSoup's get_text on the saved fixtures in benchmarks/fixtures."""
+    from virtworker.extract import article_extractor, soup_extractor
+    from virtworker.tokens import estimate_tokens
+
+    repeat = 3 if args.quick else 10
+    result = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "*.html"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        for label, extractor in (("soup", soup_extractor), ("article", article_extractor)):
+            result[f"{name}_{label}_ms"] = ms(statistics.median(measure(lambda: extractor(html), repeat)))
+            result[f"{name}_{label}_tokens"] = estimate_tokens(extractor(html).text)
+    return result
+
+
+def stub_tts_worker(stop, socket):
+    """Answer TTS requests like voice_service/run_voice_service.py, writing a tiny file instead of audio."""
+    while not stop.is_set():
+        # Only a short poll so that the thread notices ``stop``; requests are answered as soon as they arrive
+        if not socket.poll(100):
+            continue
+        request = socket.recv_json()
+        path = os.path.abspath(os.path.join("tts_output", request["output_filename"]))
+        with open(path, "wb") as f:
+            f.write(b"RIFF")
+        reply = [json.dumps({"status": "ok", "path": path}).encode()]
+        if request.get("return_audio"):
+            reply.append(b"RIFF")
+        socket.send_multipart(reply)
+    socket.close()
+
+
+def bench_audio_roundtrip(args):
+    """Round trip of generate_audio through a stub TTS worker over the voice service's ZeroMQ channel."""
+    import zmq
+
+    repeat = 2 if args.quick else 5
+    cwd = os.getcwd()
+    tmp = tempfile.mkdtemp()
+    stop = threading.Event()
+    socket = zmq.Context.instance().socket(zmq.REP)
+    port = socket.bind_to_random_port("tcp://127.0.0.1")
+    endpoint = f"tcp://127.0.0.1:{port}"
+    worker = threading.Thread(target=stub_tts_worker, args=(stop, socket), daemon=True)
+    try:
+        os.chdir(tmp)
+        os.makedirs("tts_output")
+        worker.start()
+        samples = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            virtworker.generate_audio(f"Benchmark sentence {i}.", f"bench_{i}.wav", endpoint=endpoint)
+            samples.append(time.perf_counter() - start)
+    finally:
+        stop.set()
+        worker.join()
+        os.chdir(cwd)
+        shutil.rmtree(tmp, ignore_errors=True)
+    return summary_ms("roundtrip", samples)
+
+
+BENCHMARKS = {
+    "call_overhead": bench_call_overhead,
+    "prompt_render": bench_prompt_render,
+    "throughput": bench_throughput,
+    "cache_hit": bench_cache_hit,
+    "website_text": bench_website_text,
+    "extract": bench_extract,
+    "audio_roundtrip": bench_audio_roundtrip,
+}
+
+
+def compare(results, baseline, threshold):
+    """Return the (benchmark, metric, old, new) tuples that regressed by more than ``threshold``."""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, new in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            # Differences such as overhead_median_ms can be zero or negative; a relative change means nothing there
+            if old is None or old <= 0 or metric.startswith("server_"):
+                continue
+            higher_is_better = metric.endswith("_per_s")
+            change = (old - new) / old if higher_is_better else (new - old) / old
+            marker = " REGRESSION" if change > threshold else ""
+            print(f"  {name}.{metric}: {old} -> {new} ({change * 100:+.1f}% worse){marker}"
+                  if change > 0 else f"  {name}.{metric}: {old} -> {new} ({-change * 100:.1f}% better)")
+            if change > threshold:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="Benchmarks to run")
+    parser.add_argument("--quick", action="store_true", help="Fewer repetitions and smaller inputs")
+    parser.add_argument("--save", default=DEFAULT_OUTPUT, help="Where to write the results")
+    parser.add_argument("--compare", help="Baseline result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown before flagging (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    # Only errors; node inputs, outputs and retry warnings would drown the report
+    virtworker.configure_logging(logging.ERROR)
+    results = {}
+    for name in args.only or BENCHMARKS:
+        print(f"Running {name}...", flush=True)
+        results[name] = BENCHMARKS[name](args)
+        for metric, value in results[name].items():
+            print(f"  {metric}: {value}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+    with open(args.save, "w") as f:
+        json.dump({
+            "meta": {
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "quick": args.quick,
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"Results written to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        print(f"Compared with {args.compare}:")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.threshold * 100:.0f}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import logging
 
 # Set logging level to INFO to see all output
 logging.getLogger().setLevel(logging.INFO)
+configure_logging(use_queue=True)
 
 # Use an RSS feed for Yahoo News
 yahoo_rss_feed = "https://www.yahoo.com/news/rss"
@@ -27,8 +28,8 @@ summarizer.definition = "You are a concise news summarizer. Provide a brief summ
 joke_writer = create_node("gemma2:latest", "Joke Writer")
 joke_writer.definition = "You are a clever joke writer. Based on the given summary of a news story, create a short, witty joke that's relevant to the main points of the story. The joke should be no more than 2-3 sentences."
 
-# Get the summary (only once)
-summary = summarizer(target_site.text)
+# Get the summary (only once); long pages are summarized in chunks that fit the context window
+summary = summarize(summarizer, target_site.text)
 print("Summary:", summary)
 
 # Get the initial joke
@@ -2,7 +2,9 @@ import time
 import os
 import re
 from typing import Dict
-from virtworker import create_node  # Assume this function is available
+from virtworker import configure_logging, create_node, map_chunks, Workflow, WorkflowError
+
+configure_logging(use_queue=True)
 
 def create_nodes() -> Dict[str, object]:
     print("Creating AI nodes for different writing tasks...")
@@ -63,65 +65,76 @@ def print_function_call(func):
             raise
     return wrapper
 
+def ask(node, prompt):
+    """Call ``node`` with a fresh context; steps run concurrently on shared nodes, so their turns must not mix."""
+    result = node.map([prompt], concurrency=1)[0]
+    if not result.ok:
+        raise result.error
+    return result.output
+
 @print_function_call
 def generate_story_outline(outline_node):
     prompt = "Create a detailed outline for a novel, including main plot, themes, and character arcs. Provide only the outline content, without any additional commentary or analysis."
-    return outline_node(prompt)
+    return ask(outline_node, prompt)
 
 @print_function_call
 def generate_character_arc(character_node, outline, character_number):
     prompt = f"Based on this outline:\n\n{outline}\n\nCreate a detailed character arc for Character {character_number}. Focus solely on the character's development without any meta-commentary."
-    return character_node(prompt)
+    return ask(character_node, prompt)
 
 @print_function_call
 def generate_world(world_building_node, outline):
     prompt = f"Based on this outline:\n\n{outline}\n\nCreate a detailed world for the story to take place in. Provide only world-building details without any additional analysis."
-    return world_building_node(prompt)
+    return ask(world_building_node, prompt)
 
 @print_function_call
 def generate_act(act_node, outline, act_number):
     prompt = f"Based on this outline:\n\n{outline}\n\nWrite Act {act_number} of the story. Focus on the story content without any commentary on the writing process."
-    return act_node(prompt)
+    return ask(act_node, prompt)
 
 @print_function_call
-def generate_chapter(chapter_node, act, chapter_number):
-    prompt = f"Based on this act:\n\n{act}\n\nWrite Chapter {chapter_number}. Provide only the chapter text without any suggestions for improvement."
-    return chapter_node(prompt)
+def generate_chapter(chapter_node, act, chapter_number, previous_chapter=None):
+    prompt = f"Based on this act:\n\n{act}\n\n"
+    if previous_chapter:
+        prompt += f"The previous chapter:\n\n{previous_chapter}\n\nContinue the story from where it ends. "
+    prompt += f"Write Chapter {chapter_number}. Provide only the chapter text without any suggestions for improvement."
+    return ask(chapter_node, prompt)
 
 @print_function_call
 def generate_scene(scene_node, chapter, scene_number):
     prompt = f"Based on this chapter:\n\n{chapter}\n\nWrite Scene {scene_number}. Focus solely on the scene content without any meta-analysis."
-    return scene_node(prompt)
+    return ask(scene_node, prompt)
 
 @print_function_call
 def enhance_dialogue(dialogue_node, scene):
     prompt = f"Enhance the dialogue in the following scene:\n\n{scene}\nProvide only the improved dialogue without any commentary on its effectiveness."
-    return dialogue_node(prompt)
+    return ask(dialogue_node, prompt)
 
 @print_function_call
 def manage_narrative_flow(narrative_flow_node, section):
     prompt = f"Improve the narrative flow of the following section:\n\n{section}\nFocus on the story flow without providing any editing suggestions."
-    return narrative_flow_node(prompt)
+    return ask(narrative_flow_node, prompt)
 
 @print_function_call
 def enhance_themes_and_symbolism(theme_node, section):
     prompt = f"Enhance the themes and symbolism in the following section:\n\n{section}\nProvide thematic elements without any additional analysis of their effectiveness."
-    return theme_node(prompt)
+    return ask(theme_node, prompt)
 
 @print_function_call
 def enhance_emotional_resonance(emotion_node, section):
     prompt = f"Enhance the emotional resonance of the following section:\n\n{section}\nFocus on emotional content without commenting on the writing techniques used."
-    return emotion_node(prompt)
+    return ask(emotion_node, prompt)
 
 @print_function_call
 def ensure_style_consistency(style_node, section):
     prompt = f"Ensure style consistency in the following section:\n\n{section}\nProvide stylistic improvements without any meta-commentary on the writing process."
-    return style_node(prompt)
+    return ask(style_node, prompt)
 
 @print_function_call
 def revise_story(revision_node, story):
-    prompt = f"Revise and refine the following story. Provide a complete revised version, focusing solely on improving the story without any additional commentary or suggestions:\n\n{story}"
-    return revision_node(prompt)
+    # The whole book is far larger than the context window, so revise it section by section in parallel
+    instruction = "Revise and refine the following part of a story. Provide a complete revised version, focusing solely on improving the story without any additional commentary or suggestions:"
+    return "\n\n".join(map_chunks(revision_node, story, instruction))
 
 def save_intermediate(content, filename):
     with open(filename, 'w') as f:
@@ -146,70 +159,114 @@ def final_cleanup(text):
     cleaned_lines = [line for line in lines if not line.strip().startswith('*') and not line.strip().startswith('Note:')]
     return '\n'.join(cleaned_lines)
 
+def enhance_scene(nodes, scene):
+    scene = remove_meta_commentary(scene)
+    for enhance, node_type in [
+        (enhance_dialogue, 'dialogue'),
+        (manage_narrative_flow, 'narrative_flow'),
+        (enhance_themes_and_symbolism, 'theme'),
+        (enhance_emotional_resonance, 'emotion'),
+        (ensure_style_consistency, 'style'),
+    ]:
+        scene = remove_meta_commentary(enhance(nodes[node_type], scene))
+    return scene
+
+def assemble_book(results, character_steps, act_steps):
+    """Put the book together from the workflow results, leaving out anything that was not generated."""
+    character_arcs = [results[name] for name in character_steps if name in results]
+    book_content = f"# Novel\n\n## World\n{results.get('world', '')}\n\n## Characters\n"
+    for arc in character_arcs:
+        book_content += f"{arc}\n\n"
+    for act_number, (act_step, chapter_steps) in enumerate(act_steps, 1):
+        if act_step not in results:
+            continue
+        book_content += f"## Act {act_number}\n{results[act_step]}\n\n"
+        for name in chapter_steps:
+            if name in results:
+                book_content += results[name]
+    return book_content
+
 @print_function_call
-def generate_book():
+def generate_book(max_concurrency=4):
     nodes = create_nodes()
-    
-    try:
-        print("Generating story outline...")
-        outline = generate_story_outline(nodes['outline'])
-        outline = remove_meta_commentary(outline)
+    workflow = Workflow("Novel", max_concurrency=max_concurrency)
+
+    def outline_step():
+        outline = remove_meta_commentary(generate_story_outline(nodes['outline']))
         save_intermediate(outline, "outline.txt")
-        
-        print("Generating character arcs...")
-        character_arcs = [generate_character_arc(nodes['character'], outline, i) for i in range(1, 6)]
-        character_arcs = [remove_meta_commentary(arc) for arc in character_arcs]
-        save_intermediate("\n\n".join(character_arcs), "character_arcs.txt")
-        
-        print("Generating world...")
-        world = generate_world(nodes['world_building'], outline)
-        world = remove_meta_commentary(world)
-        save_intermediate(world, "world.txt")
-        
-        book_content = f"# Novel\n\n## World\n{world}\n\n## Characters\n"
-        for arc in character_arcs:
-            book_content += f"{arc}\n\n"
-        
-        for act_number in range(1, 4):
-            print(f"Generating Act {act_number}...")
-            act = generate_act(nodes['act'], outline, act_number)
-            act = remove_meta_commentary(act)
-            book_content += f"## Act {act_number}\n{act}\n\n"
-            
-            for chapter_number in range(1, 11):
-                print(f"Generating Chapter {chapter_number} of Act {act_number}...")
-                chapter = generate_chapter(nodes['chapter'], act, chapter_number)
-                chapter = remove_meta_commentary(chapter)
-                book_content += f"### Chapter {chapter_number}\n{chapter}\n\n"
-                
-                for scene_number in range(1, 6):
-                    print(f"Generating Scene {scene_number} of Chapter {chapter_number}, Act {act_number}...")
-                    scene = generate_scene(nodes['scene'], chapter, scene_number)
-                    scene = remove_meta_commentary(scene)
-                    enhanced_scene = enhance_dialogue(nodes['dialogue'], scene)
-                    enhanced_scene = remove_meta_commentary(enhanced_scene)
-                    enhanced_scene = manage_narrative_flow(nodes['narrative_flow'], enhanced_scene)
-                    enhanced_scene = remove_meta_commentary(enhanced_scene)
-                    enhanced_scene = enhance_themes_and_symbolism(nodes['theme'], enhanced_scene)
-                    enhanced_scene = remove_meta_commentary(enhanced_scene)
-                    enhanced_scene = enhance_emotional_resonance(nodes['emotion'], enhanced_scene)
-                    enhanced_scene = remove_meta_commentary(enhanced_scene)
-                    enhanced_scene = ensure_style_consistency(nodes['style'], enhanced_scene)
-                    enhanced_scene = remove_meta_commentary(enhanced_scene)
-                    book_content += f"{enhanced_scene}\n\n"
-                
-                save_intermediate(book_content, f"act_{act_number}_chapter_{chapter_number}.txt")
-        
-        print("Revising the entire story...")
+        return outline
+    workflow.add_step("outline", outline_step)
+
+    character_steps = []
+    for i in range(1, 6):
+        character_steps.append(workflow.add_step(
+            f"character_{i}",
+            lambda outline, i=i: remove_meta_commentary(generate_character_arc(nodes['character'], outline, i)),
+            depends_on=["outline"]))
+
+    workflow.add_step("world", lambda outline: remove_meta_commentary(generate_world(nodes['world_building'], outline)),
+                      depends_on=["outline"])
+
+    act_steps = []
+    for act_number in range(1, 4):
+        act_step = workflow.add_step(
+            f"act_{act_number}",
+            lambda outline, n=act_number: remove_meta_commentary(generate_act(nodes['act'], outline, n)),
+            depends_on=["outline"])
+        chapter_text_steps = []
+        act_steps.append((act_step, chapter_text_steps))
+
+        chapter_step = None
+        for chapter_number in range(1, 11):
+            # Each chapter follows on from the previous one; their scenes still run in parallel
+            chapter_step = workflow.add_step(
+                f"act_{act_number}_chapter_{chapter_number}",
+                lambda act, previous=None, n=chapter_number: remove_meta_commentary(
+                    generate_chapter(nodes['chapter'], act, n, previous)),
+                depends_on=[act_step] + ([chapter_step] if chapter_step else []))
+
+            scene_steps = []
+            for scene_number in range(1, 6):
+                scene_steps.append(workflow.add_step(
+                    f"act_{act_number}_chapter_{chapter_number}_scene_{scene_number}",
+                    lambda chapter, n=scene_number: enhance_scene(nodes, generate_scene(nodes['scene'], chapter, n)),
+                    depends_on=[chapter_step]))
+
+            # Save each chapter as soon as its scenes are done, so a later failure loses nothing finished
+            def chapter_text(chapter, *scenes, a=act_number, n=chapter_number):
+                text = f"### Chapter {n}\n{chapter}\n\n" + "".join(f"{scene}\n\n" for scene in scenes)
+                save_intermediate(text, f"act_{a}_chapter_{n}.txt")
+                return text
+            chapter_text_steps.append(workflow.add_step(
+                f"act_{act_number}_chapter_{chapter_number}_text", chapter_text,
+                depends_on=[chapter_step] + scene_steps))
+
+    try:
+        results = workflow.run()
+    except WorkflowError as e:
+        print(f"Error in book generation: {str(e)}")
+        for name, error in e.failed.items():
+            print(f"  {name}: {error}")
+        save_intermediate(assemble_book(e.results, character_steps, act_steps), "partial_book.txt")
+        return None
+    workflow.print_timings()
+
+    save_intermediate("\n\n".join(results[name] for name in character_steps), "character_arcs.txt")
+    save_intermediate(results["world"], "world.txt")
+    book_content = assemble_book(results, character_steps, act_steps)
+    # Keep the unrevised draft in case the revision fails
+    save_intermediate(book_content, "draft_book.txt")
+
+    print("Revising the entire story...")
+    try:
         final_book = revise_story(nodes['revision'], book_content)
-        final_book = remove_meta_commentary(final_book)
-        final_book = final_cleanup(final_book)
-        
-        return final_book
-    
     except Exception as e:
-        print(f"Error in book generation: {str(e)}")
+        print(f"Error revising the book: {str(e)}")
         return None
+    final_book = remove_meta_commentary(final_book)
+    final_book = final_cleanup(final_book)
+
+    return final_book
 
 if __name__ == "__main__":
     book = generate_book()
@@ -218,11 +275,12 @@ if __name__ == "__main__":
         with open(filename, "w") as f:
             f.write(book)
         print(f"Book generation complete. The book has been saved as '{filename}'.")
-    else:
-        print("Book generation failed.")
 
-    # Clean up intermediate files
-    for file in os.listdir():
-        if file.endswith(".txt") and file != filename:
-            os.remove(file)
-            print(f"Removed intermediate file: {file}")
+        # Clean up intermediate files
+        for file in os.listdir():
+            if file.endswith(".txt") and file != filename:
+                os.remove(file)
+                print(f"Removed intermediate file: {file}")
+    else:
+        # Keep the saved chapters and partial_book.txt or draft_book.txt
+        print("Book generation failed. The chapters generated so far have been kept.")
@@ -4,10 +4,12 @@ import yaml
 import re
 import time
 import zmq
-from virtworker import create_node
+from virtworker import configure_logging, create_node
 
 # Set logging level to INFO to see all output
 logging.getLogger().setLevel(logging.INFO)
+# Log node inputs and outputs from a background thread; writing whole chapters to the terminal is slow
+configure_logging(use_queue=True)
 
 # Function to create a node with retry mechanism
 def create_node_with_retry(model, name, max_retries=3, retry_delay=5):
@@ -28,6 +30,10 @@ story_arc_generator = create_node_with_retry("gemma2:latest", "Story Arc Generat
 chapter_writer = create_node_with_retry("gemma2:latest", "Chapter Writer")
 editor = create_node_with_retry("gemma2:latest", "Editor")
 
+# Keep earlier chapters as a running summary instead of resending them in full
+chapter_writer.max_context_tokens = 6000
+chapter_writer.context_mode = "summarize"
+
 # Node definitions
 character_generator.definition = """You are an expert character creator for a cyberpunk science fiction novel. Your task is to generate unique, complex characters that fit seamlessly into a high-tech, dystopian future world. When prompted, create a character with the following details:
 
@@ -3,10 +3,11 @@ import random
 import json
 import re
 import time
-from virtworker import create_node
+from virtworker import configure_logging, create_node
 
 # Set logging level to INFO to see all output
 logging.getLogger().setLevel(logging.INFO)
+configure_logging(use_queue=True)
 
 # Create nodes
 topic_generator = create_node("llama3.1:8b", "Topic Generator")
@@ -8,10 +8,10 @@ log() {
     echo "[$(date '+%Y-%m-%d %H:%M:%S')] $1"
 }
 
-# Clean up old request and output files
+# Clean up old output files
 log "Cleaning up old files..."
-rm -rf tts_requests tts_output
-mkdir tts_requests tts_output
+rm -rf tts_output
+mkdir tts_output
 
 # Start LLM service
 log "Starting LLM service..."
@@ -0,0 +1,30 @@
+import pytest
+
+from virtworker.fakeserver import FakeOllama
+from virtworker.node import Node
+from virtworker.transport import Transport
+
+
+@pytest.fixture
+def fake():
+    with FakeOllama(ttft=0.0, tokens_per_second=1e6, response_tokens=8) as server:
+        yield server
+
+
+@pytest.fixture
+def make_node(fake):
+    """Nodes talking to the fake server through their own transport."""
+    transports = []
+
+    def make(name="Test", model="llama3", **transport_options):
+        transport_options.setdefault("backoff", 0.0)
+        transport = Transport(fake.url, **transport_options)
+        transports.append(transport)
+        node = Node(model, name)
+        node.transport = transport
+        node.raise_errors = True
+        return node
+
+    yield make
+    for transport in transports:
+        transport.close()
@@ -0,0 +1,122 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from virtworker.cache import ResponseCache
+
+
+def test_concurrent_misses_share_one_computation():
+    cache = ResponseCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "value"
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(cache.get_or_compute, "key", compute)
+        started.wait(5)
+        waiters = [executor.submit(cache.get_or_compute, "key", compute) for _ in range(3)]
+        while cache.coalesced < 3:
+            threading.Event().wait(0.01)
+        release.set()
+        results = [leader.result()] + [waiter.result() for waiter in waiters]
+
+    assert results == ["value"] * 4
+    assert len(calls) == 1
+    assert cache.coalesced == 3
+    assert cache.get_or_compute("key", compute) == "value"
+    assert len(calls) == 1
+
+
+def test_failed_computation_reaches_every_waiter_and_is_not_cached():
+    cache = ResponseCache()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("backend down")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(cache.get_or_compute, "key", fail)
+        started.wait(5)
+        waiter = executor.submit(cache.get_or_compute, "key", fail)
+        while cache.coalesced < 1:
+            threading.Event().wait(0.01)
+        release.set()
+        for future in (leader, waiter):
+            with pytest.raises(RuntimeError):
+                future.result()
+
+    assert cache.get_or_compute("key", lambda: "retried") == "retried"
+
+
+def test_disk_cache_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    ResponseCache(path=path).set("key", "value")
+    cache = ResponseCache(path=path)
+    assert cache.get("key") == "value"
+    assert cache.disk_hits == 1
+
+
+def test_coalesced_waiters_are_not_counted_as_misses():
+    cache = ResponseCache()
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(cache.get_or_compute, "key", lambda: release.wait(5) and "value")
+        while not cache._inflight:
+            threading.Event().wait(0.01)
+        waiter = executor.submit(cache.get_or_compute, "key", lambda: "other")
+        while cache.coalesced < 1:
+            threading.Event().wait(0.01)
+        release.set()
+        assert leader.result() == waiter.result() == "value"
+    assert (cache.misses, cache.coalesced) == (1, 1)
+
+
+def test_identical_async_calls_share_one_request(fake, make_node):
+    fake.ttft = 0.2
+    cache = ResponseCache()
+    nodes = [make_node(f"Async {i}") for i in range(3)]
+    for node in nodes:
+        node.cache = cache
+
+    async def main():
+        return await asyncio.gather(*(node.acall("same question") for node in nodes))
+
+    outputs = asyncio.run(main())
+    assert len(set(outputs)) == 1
+    assert fake.requests == 1
+    assert cache.coalesced == 2
+
+
+def test_identical_streams_share_one_request(fake, make_node):
+    fake.ttft = 0.2
+    cache = ResponseCache()
+    nodes = [make_node(f"Stream {i}") for i in range(2)]
+    for node in nodes:
+        node.cache = cache
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        outputs = list(executor.map(lambda node: "".join(node.stream("same question")).strip(), nodes))
+    assert outputs[0] == outputs[1]
+    assert fake.requests == 1
+    assert cache.coalesced == 1
+
+
+def test_abandoned_stream_releases_its_waiters(fake, make_node):
+    cache = ResponseCache()
+    node = make_node()
+    node.cache = cache
+    stream = node.stream("question")
+    next(stream)
+    stream.close()
+    assert not cache._inflight
+    assert "".join(node.stream("question"))
@@ -0,0 +1,110 @@
+from virtworker import node as node_module
+from virtworker.context import SUMMARY_PREFIX, trim_context
+from virtworker.tokens import estimate_tokens
+
+
+def conversation(turns, pinned=()):
+    context = [{"role": "system", "content": text, "pinned": True} for text in pinned]
+    for i in range(turns):
+        context.append({"role": "user", "content": f"question {i}"})
+        context.append({"role": "assistant", "content": f"answer {i}"})
+    return context
+
+
+def test_trim_drops_the_oldest_turns_and_keeps_pinned_messages():
+    context = conversation(5, pinned=["rules"])
+    kept, evicted = trim_context(context, max_turns=3)
+    assert [msg["content"] for msg in evicted] == ["question 0", "answer 0", "question 1", "answer 1"]
+    assert kept[0]["content"] == "rules"
+    assert [msg["content"] for msg in kept[1::2]] == ["question 2", "question 3", "question 4"]
+
+
+def test_trim_respects_the_token_budget():
+    context = conversation(4)
+    kept, evicted = trim_context(context, max_tokens=4, count_tokens=lambda text: 1)
+    assert len(kept) == 4 and len(evicted) == 4
+
+
+def test_batch_trim_halves_both_limits_once_over():
+    context = conversation(4)
+    assert trim_context(context, max_turns=4, batch=True) == (context, [])
+    kept, evicted = trim_context(conversation(5), max_turns=4, batch=True)
+    assert len(kept) == 4 and len(evicted) == 6
+
+
+def test_summarize_mode_replaces_evicted_turns_with_a_summary(make_node):
+    node = make_node()
+    node.context_mode = "summarize"
+    node.max_context_length = 4
+    for i in range(6):
+        node(f"turn {i}")
+    # The sixth call found five turns, summarized three and kept two plus its own
+    summary = node.context[0]
+    assert summary["pinned"] and summary["content"].startswith(SUMMARY_PREFIX)
+    assert [msg["content"] for msg in node.context if msg["role"] == "user"] == ["turn 3", "turn 4", "turn 5"]
+
+
+def test_turns_finished_while_summarizing_are_kept(make_node):
+    node = make_node()
+    node.context_mode = "summarize"
+    node.max_context_length = 2
+    for i in range(3):
+        node._finish(f"turn {i}", f"answer {i}")
+    summarize_evicted = node._summarize_evicted
+
+    def slow_summary(kept, evicted):
+        # Another call on the node finishes while the summary is written
+        node._finish("concurrent", "answer")
+        return summarize_evicted(kept, evicted)
+
+    node._summarize_evicted = slow_summary
+    node._fit_context()
+    assert node.context[0].get("summary")
+    assert [msg["content"] for msg in node.context if msg["role"] == "user"] == ["turn 2", "concurrent"]
+
+
+def test_clearing_the_context_while_summarizing_wins(make_node):
+    node = make_node()
+    node.context_mode = "summarize"
+    node.max_context_length = 2
+    for i in range(3):
+        node._finish(f"turn {i}", f"answer {i}")
+    summarize_evicted = node._summarize_evicted
+
+    def clear_first(kept, evicted):
+        node.clear_context()
+        return summarize_evicted(kept, evicted)
+
+    node._summarize_evicted = clear_first
+    node._fit_context()
+    assert node.context == []
+
+
+def test_trim_without_a_token_budget_counts_nothing():
+    counted = []
+    trim_context(conversation(5), max_turns=3, count_tokens=counted.append)
+    assert counted == []
+
+
+def test_each_call_counts_only_the_new_turn(make_node, monkeypatch):
+    counted = []
+
+    def count(text, model_name=None):
+        counted.append(text)
+        return estimate_tokens(text)
+
+    monkeypatch.setattr(node_module, "count_tokens", count)
+    node = make_node()
+    node.max_context_length = 100
+    node.max_context_tokens = 10 ** 6
+    for i in range(20):
+        del counted[:]
+        node._prepare(f"turn {i} " + "words " * 50, 64, stream=False)
+        node._finish(f"turn {i} " + "words " * 50, "answer " * 50)
+    # The history is about 13000 characters by now; only the last turn (for trimming and for the prompt)
+    # and the new input were counted
+    assert sum(map(len, counted)) < 2000
+    prompt, tokens = node._prompt_builder.render_counted(node.prompt_template, node.definition, node.context,
+                                                         "next", node._counter)
+    # Counting the parts separately rounds up once per part
+    assert 0 <= tokens - estimate_tokens(prompt) <= len(node.context) + 2
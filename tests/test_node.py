@@ -0,0 +1,35 @@
+import pytest
+
+from virtworker.errors import OllamaError
+
+
+def test_stream_yields_tokens_and_records_the_turn(make_node):
+    node = make_node()
+    output = "".join(node.stream("Hello")).strip()
+    assert output
+    assert node.context[-1] == {"role": "assistant", "content": output}
+    assert node.last_ttft is not None
+
+
+def test_stream_raises_failed_calls_with_raise_errors(fake, make_node):
+    node = make_node(max_retries=0)
+    fake.fail_next(1, status=500)
+    with pytest.raises(OllamaError):
+        list(node.stream("Hello", raise_errors=True))
+    assert node.context == []
+
+
+def test_stream_yields_the_error_message_by_default(fake, make_node):
+    node = make_node(max_retries=0)
+    node.raise_errors = False
+    fake.fail_next(1, status=500)
+    tokens = list(node.stream("Hello"))
+    assert len(tokens) == 1 and tokens[0].startswith("Error in Ollama API call: 500")
+
+
+def test_failed_call_returns_the_error_message_unless_raise_errors(fake, make_node):
+    node = make_node(max_retries=0)
+    fake.fail_next(2, status=500)
+    assert node("Hello", raise_errors=False).startswith("Error in Ollama API call: 500")
+    with pytest.raises(OllamaError):
+        node("Hello")
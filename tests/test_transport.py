@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from virtworker.errors import CircuitOpenError, OllamaUnavailableError
+from virtworker.fakeserver import FakeOllama
+from virtworker.pool import BackendPool
+from virtworker.transport import CircuitBreaker, Transport
+
+
+def test_pool_fails_over_to_the_next_endpoint(fake):
+    other = FakeOllama(ttft=0.0, tokens_per_second=1e6).start()
+    pool = BackendPool([other.url, fake.url], backoff=0.0, connect_timeout=0.5)
+    try:
+        other.stop()
+        for _ in range(3):
+            response = pool.post("/api/generate", json={"model": "llama3", "prompt": "hi", "stream": False})
+            assert response.status_code == 200
+        down, up = pool.status()
+        assert not down["healthy"]
+        assert up["healthy"] and up["completed"] == 3
+        assert fake.requests == 3
+    finally:
+        pool.close()
+
+
+def test_pool_raises_when_no_endpoint_is_left():
+    server = FakeOllama().start()
+    pool = BackendPool([server.url], backoff=0.0, connect_timeout=0.5)
+    server.stop()
+    try:
+        with pytest.raises(OllamaUnavailableError):
+            pool.post("/api/generate", json={"model": "llama3", "prompt": "hi", "stream": False})
+    finally:
+        pool.close()
+
+
+def test_breaker_opens_and_lets_a_trial_call_through_when_half_open(fake):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+    transport = Transport(fake.url, max_retries=0, backoff=0.0, breaker=breaker)
+    body = {"model": "llama3", "prompt": "hi", "stream": False}
+    try:
+        fake.fail_next(2, status=503)
+        assert transport.post("/api/generate", json=body).status_code == 503
+        assert breaker.state == "closed"
+        assert transport.post("/api/generate", json=body).status_code == 503
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            transport.post("/api/generate", json=body)
+
+        time.sleep(0.25)
+        assert breaker.state == "half-open"
+        assert transport.post("/api/generate", json=body).status_code == 200
+        assert breaker.state == "closed"
+    finally:
+        transport.close()
+
+
+def test_failed_trial_call_reopens_the_breaker(fake):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.2)
+    transport = Transport(fake.url, max_retries=0, backoff=0.0, breaker=breaker)
+    body = {"model": "llama3", "prompt": "hi", "stream": False}
+    try:
+        fake.fail_next(2, status=503)
+        transport.post("/api/generate", json=body)
+        time.sleep(0.25)
+        assert breaker.state == "half-open"
+        assert transport.post("/api/generate", json=body).status_code == 503
+        assert breaker.state == "open"
+    finally:
+        transport.close()
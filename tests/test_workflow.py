@@ -0,0 +1,72 @@
+import pytest
+
+from virtworker import workflow as workflow_module
+from virtworker.workflow import Workflow, WorkflowError
+
+
+def test_results_flow_along_dependencies():
+    workflow = Workflow("test")
+    workflow.add_step("a", lambda: 1)
+    workflow.add_step("b", lambda a: a + 1, depends_on=["a"])
+    workflow.add_step("c", lambda a, b: a * 10 + b, depends_on=["a", "b"])
+    assert workflow.run() == {"a": 1, "b": 2, "c": 12}
+
+
+def test_failure_skips_dependents_and_keeps_independent_results():
+    def fail(a):
+        raise RuntimeError("step failed")
+
+    workflow = Workflow("test")
+    workflow.add_step("a", lambda: 1)
+    workflow.add_step("b", fail, depends_on=["a"])
+    workflow.add_step("c", lambda b: b, depends_on=["b"])
+    workflow.add_step("d", lambda c: c, depends_on=["c"])
+    workflow.add_step("e", lambda a: a + 1, depends_on=["a"])
+    with pytest.raises(WorkflowError) as info:
+        workflow.run()
+    assert list(info.value.failed) == ["b"]
+    assert isinstance(info.value.failed["b"], RuntimeError)
+    assert info.value.results == {"a": 1, "e": 2}
+
+
+def test_failed_node_call_fails_its_step(fake, make_node):
+    node = make_node(max_retries=0)
+    node.raise_errors = False
+    workflow = Workflow("test")
+    workflow.add_step("topic", lambda: "cats")
+    workflow.add_node_step("summary", node, "Summarize {0}", depends_on=["topic"])
+    workflow.add_node_step("joke", node, "A joke about {0}", depends_on=["summary"])
+    fake.fail_next(1, status=500)
+    with pytest.raises(WorkflowError) as info:
+        workflow.run()
+    assert list(info.value.failed) == ["summary"]
+    assert "joke" not in info.value.results
+
+
+def test_node_steps_leave_the_node_context_alone(make_node):
+    node = make_node()
+    workflow = Workflow("test")
+    workflow.add_step("topic", lambda: "cats")
+    workflow.add_node_step("one", node, "First about {0}", depends_on=["topic"])
+    workflow.add_node_step("two", node, "Second about {0}", depends_on=["topic"])
+    workflow.run()
+    assert node.context == []
+
+
+def test_cycles_are_rejected():
+    workflow = Workflow("test")
+    workflow.add_step("a", lambda b: b, depends_on=["b"])
+    workflow.add_step("b", lambda a: a, depends_on=["a"])
+    with pytest.raises(ValueError):
+        workflow.run()
+
+
+def test_preload_goes_through_the_node_transport(make_node, monkeypatch):
+    preloaded = []
+    monkeypatch.setattr(workflow_module, "preload_model",
+                        lambda model, keep_alive=None, transport=None: preloaded.append((model, transport)))
+    node = make_node()
+    workflow = Workflow("test", preload=True)
+    workflow.add_node_step("answer", node, "Question")
+    workflow.run()
+    assert preloaded == [("llama3", node.transport)]
@@ -6,6 +6,8 @@ from typing import List, Tuple
 class ContextAwareSelfThinkingAI:
     def __init__(self, model_name: str = "llama3.1:8b", max_tokens: int = 16384):
         self.node = create_node(model_name, "Context-Aware Self-Thinking AI", max_tokens=max_tokens)
+        self.node.context_mode = "summarize"
+        self.node.reuse_kv = True
         self.memory: List[str] = []
         self.current_topic: str = ""
         self.topics = [
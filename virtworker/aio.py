@@ -0,0 +1,96 @@
+"""Shared aiohttp client used by ``Node.acall``.
+
+One ``ClientSession`` is kept per event loop so that every node talking to
+Ollama from the same loop reuses the same connection pool. The session is
+closed when the loop shuts down its async generators, which ``asyncio.run``
+does before returning, so ``close_session()`` is only needed to close it
+earlier.
+"""
+import asyncio
+import logging
+import weakref
+
+import aiohttp
+
+from .errors import OllamaUnavailableError
+from .transport import RETRY_STATUSES
+
+logger = logging.getLogger(__name__)
+
+_sessions = weakref.WeakKeyDictionary()  # loop -> (session, generator that closes it at loop shutdown)
+_connection_limit = 32
+
+
+def set_connection_limit(limit: int):
+    global _connection_limit
+    _connection_limit = limit
+
+
+async def _close_at_shutdown(session):
+    try:
+        yield
+    finally:
+        loop = asyncio.get_running_loop()
+        entry = _sessions.get(loop)
+        if entry is not None and entry[0] is session:
+            del _sessions[loop]
+        if not session.closed:
+            await session.close()
+
+
+def get_session() -> aiohttp.ClientSession:
+    loop = asyncio.get_running_loop()
+    entry = _sessions.get(loop)
+    if entry is None or entry[0].closed:
+        connector = aiohttp.TCPConnector(limit=_connection_limit)
+        session = aiohttp.ClientSession(connector=connector)
+        closer = _close_at_shutdown(session)
+        # Run the generator up to its yield; that registers it with the loop, which
+        # closes it (and so the session) in shutdown_asyncgens
+        try:
+            closer.asend(None).send(None)
+        except StopIteration:
+            pass
+        _sessions[loop] = (session, closer)
+        return session
+    return entry[0]
+
+
+async def close_session():
+    loop = asyncio.get_running_loop()
+    entry = _sessions.pop(loop, None)
+    if entry is not None:
+        session, closer = entry
+        if not session.closed:
+            await session.close()
+        await closer.aclose()
+
+
+async def post_json(transport, path, body):
+    """POST ``body`` to ``transport``'s endpoint with its timeouts, retries and breaker.
+
+    Returns ``(status, payload)`` where payload is the decoded JSON for a 200
+    response and the response text otherwise.
+    """
+    transport.breaker.before_call(transport.base_url)
+    timeout = aiohttp.ClientTimeout(sock_connect=transport.connect_timeout, sock_read=transport.read_timeout)
+    url = transport.base_url + path
+    for attempt in range(transport.max_retries + 1):
+        last_attempt = attempt == transport.max_retries
+        try:
+            async with get_session().post(url, json=body, timeout=timeout) as response:
+                if response.status not in RETRY_STATUSES:
+                    transport.breaker.record_success()
+                    if response.status == 200:
+                        return response.status, await response.json()
+                    return response.status, await response.text()
+                if last_attempt:
+                    transport.breaker.record_failure()
+                    return response.status, await response.text()
+                logger.warning("Request to %s returned %d, retrying", url, response.status)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if last_attempt:
+                transport.breaker.record_failure()
+                raise OllamaUnavailableError(f"Ollama is not reachable at {transport.base_url} ({e})") from e
+            logger.warning("Request to %s failed (%s), retrying", url, e.__class__.__name__)
+        await asyncio.sleep(transport.retry_delay(attempt))
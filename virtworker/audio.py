@@ -0,0 +1,50 @@
+"""Text-to-speech through the voice service (voice_service/run_voice_service.py).
+
+Requests go over a ZeroMQ request-reply socket, so the reply arrives the
+moment the audio is ready instead of on the next poll of a directory. The
+service listens on ``VIRTWORKER_TTS_ENDPOINT`` (``tcp://127.0.0.1:5556`` by
+default), and both sides read that variable.
+"""
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENDPOINT = "tcp://127.0.0.1:5556"
+
+
+def tts_endpoint():
+    return os.environ.get("VIRTWORKER_TTS_ENDPOINT") or DEFAULT_ENDPOINT
+
+
+def generate_audio(text, filename, return_bytes=False, endpoint=None, timeout=300):
+    """Have the voice service speak ``text`` into ``filename`` in its ``tts_output`` directory.
+
+    Returns the path of the WAV file, or its contents with ``return_bytes``.
+    Returns None when the service reports an error or does not answer
+    within ``timeout`` seconds.
+    """
+    import zmq
+
+    endpoint = endpoint or tts_endpoint()
+    socket = zmq.Context.instance().socket(zmq.REQ)
+    # Never keep an unanswered request around once we stop waiting for it
+    socket.setsockopt(zmq.LINGER, 0)
+    try:
+        socket.connect(endpoint)
+        socket.send_json({"text": text, "output_filename": filename, "return_audio": return_bytes})
+        logger.info("TTS request sent to %s", endpoint)
+        if not socket.poll(timeout * 1000):
+            logger.error("Timeout waiting for TTS output")
+            return None
+        frames = socket.recv_multipart()
+    finally:
+        socket.close()
+
+    reply = json.loads(frames[0])
+    if reply.get("status") != "ok":
+        logger.error("TTS request failed: %s", reply.get("error"))
+        return None
+    logger.info("TTS output received: %s", reply["path"])
+    return frames[1] if return_bytes else reply["path"]
@@ -0,0 +1,192 @@
+"""Response cache for node calls.
+
+Responses are keyed on a hash of the model, the fully rendered prompt and the
+generation options. Lookups go through a bounded in-memory LRU first and an
+optional SQLite file second, and identical requests that are already in
+flight share a single backend call.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def make_key(model, prompt, options=None):
+    payload = json.dumps({"model": model, "prompt": prompt, "options": options or {}},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_memory_entries=256, path=None, ttl=None, max_disk_entries=10000):
+        self.max_memory_entries = max_memory_entries
+        self.path = path
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            with self._db_lock, self._db:
+                self._db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL)""")
+                self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+
+    def _remember(self, key, value):
+        # Caller holds self._lock
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key):
+        if self._db is None:
+            return None
+        now = time.time()
+        with self._db_lock:
+            row = self._db.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            with self._db:
+                if self.ttl is not None and now - created_at > self.ttl:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    return None
+                self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def _disk_set(self, key, value):
+        if self._db is None:
+            return
+        now = time.time()
+        with self._db_lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                             (key, value, now, now))
+            if self.ttl is not None:
+                self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_disk_entries:
+                self._db.execute("""DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY accessed_at LIMIT ?)""", (count - self.max_disk_entries,))
+
+    def _lookup(self, key):
+        """Return the cached value or None, counting hits but not misses."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+        value = self._disk_get(key)
+        if value is not None:
+            with self._lock:
+                self.disk_hits += 1
+                self._remember(key, value)
+        return value
+
+    def get(self, key):
+        value = self._lookup(key)
+        if value is None:
+            with self._lock:
+                self.misses += 1
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+        self._disk_set(key, value)
+
+    def claim(self, key):
+        """Look up ``key`` for a caller that will compute it on a miss.
+
+        Returns ``(value, future, leader)``. On a hit ``value`` is the cached
+        value. On a miss ``future`` is the in-flight computation: waiters get
+        its result with ``future.result()``, and the one ``leader`` has to
+        compute the value and pass it, or the exception, to ``resolve``.
+        """
+        value = self._lookup(key)
+        if value is not None:
+            return value, None, False
+        with self._lock:
+            # The previous leader may have finished since our lookup
+            if key in self._memory:
+                self.memory_hits += 1
+                return self._memory[key], None, False
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return None, future, False
+            self.misses += 1
+            future = self._inflight[key] = Future()
+            return None, future, True
+
+    def resolve(self, key, future, value=None, error=None):
+        """Finish a computation claimed with ``claim``; with ``error`` nothing is cached."""
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                self.set(key, value)
+                future.set_result(value)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for ``key``, calling ``compute()`` on a miss.
+
+        Concurrent callers asking for the same key while it is being computed
+        wait for that result instead of issuing their own call. Exceptions are
+        passed on to every waiter and nothing is cached.
+        """
+        value, future, leader = self.claim(key)
+        if value is not None:
+            return value
+        if not leader:
+            return future.result()
+        try:
+            value = compute()
+        except BaseException as e:
+            self.resolve(key, future, error=e)
+            raise
+        self.resolve(key, future, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            with self._db_lock, self._db:
+                self._db.execute("DELETE FROM responses")
+
+    def stats(self):
+        with self._lock:
+            # Coalesced lookups waited for another call instead of making their own, so they count as saved
+            hits = self.memory_hits + self.disk_hits + self.coalesced
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
@@ -0,0 +1,79 @@
+"""Context window management for nodes.
+
+A node's context is a list of ``{"role": ..., "content": ...}`` messages.
+Messages marked ``"pinned": True`` are never evicted. Everything else is
+grouped into turns (a user message and the replies that follow it) and the
+oldest turns are dropped until the history fits both the turn limit and the
+token budget.
+"""
+from .tokens import estimate_tokens
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+
+def context_tokens(context, count_tokens=estimate_tokens):
+    return sum(count_tokens(msg["content"]) for msg in context)
+
+
+def _turns(context):
+    turns = []
+    for msg in context:
+        if msg.get("pinned"):
+            continue
+        if msg["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append(msg)
+    return turns
+
+
+def trim_context(context, max_turns=None, max_tokens=None, count_tokens=estimate_tokens, batch=False):
+    """Split ``context`` into the messages to keep and the ones to evict.
+
+    Pinned messages are always kept, even if they alone exceed ``max_tokens``.
+    The order of the kept messages is preserved. With ``batch``, a context
+    over either limit is trimmed down to half of both, so the next several
+    turns fit without another eviction.
+    """
+    turns = _turns(context)
+    if max_tokens is None:
+        # Only the turn limit applies, so nothing needs counting
+        turn_tokens = [0] * len(turns)
+        total = 0
+    else:
+        pinned_tokens = sum(count_tokens(msg["content"]) for msg in context if msg.get("pinned"))
+        turn_tokens = [sum(count_tokens(msg["content"]) for msg in turn) for turn in turns]
+        total = pinned_tokens + sum(turn_tokens)
+
+    over = (max_turns is not None and len(turns) > max_turns) or (max_tokens is not None and total > max_tokens)
+    if batch and over:
+        max_turns = max(1, max_turns // 2) if max_turns is not None else None
+        max_tokens = max_tokens // 2 if max_tokens is not None else None
+
+    drop = 0
+    while drop < len(turns):
+        too_many = max_turns is not None and len(turns) - drop > max_turns
+        too_long = max_tokens is not None and total > max_tokens
+        if not (too_many or too_long):
+            break
+        total -= turn_tokens[drop]
+        drop += 1
+
+    if drop == 0:
+        return list(context), []
+    evicted_ids = {id(msg) for turn in turns[:drop] for msg in turn}
+    kept = [msg for msg in context if id(msg) not in evicted_ids]
+    evicted = [msg for msg in context if id(msg) in evicted_ids]
+    return kept, evicted
+
+
+def summary_prompt(evicted, previous_summary=None):
+    transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in evicted)
+    if previous_summary:
+        transcript = f"Earlier summary: {previous_summary}\n{transcript}"
+    return ("Summarize the following conversation so it can replace the original messages. "
+            "Keep names, facts, decisions and open questions. Reply with the summary only.\n\n"
+            f"{transcript}")
+
+
+def summary_message(summary):
+    return {"role": "system", "content": SUMMARY_PREFIX + summary, "pinned": True, "summary": True}
@@ -0,0 +1,155 @@
+"""Local text files as a streaming input source.
+
+A ``Document`` memory-maps its file and yields it in chunks of at most about
+``chunk_tokens`` tokens, either packed from whole paragraphs or cut at the
+nearest whitespace. Only the chunk being yielded is copied out of the map, so
+a multi-gigabyte file never has to fit in memory as a Python string.
+
+``Document.process(node)`` streams the chunks through ``Node.imap`` and, with
+a ``checkpoint`` file, records the byte offset after every chunk whose result
+was consumed, so that an interrupted run resumes where it stopped.
+Files must be UTF-8 or another ASCII-compatible encoding.
+"""
+import json
+import logging
+import mmap
+import os
+import re
+from collections import deque, namedtuple
+
+logger = logging.getLogger(__name__)
+
+PARAGRAPH_BREAK = re.compile(rb"\n[ \t\r]*\n")
+BYTES_PER_TOKEN = 4  # Same estimate as tokens.estimate_tokens; bytes are never fewer than characters
+
+
+class Chunk(namedtuple("Chunk", ["index", "start", "end", "text"])):
+    """Text of the file between byte offsets ``start`` and ``end``."""
+
+
+class Document:
+    def __init__(self, path, chunk_tokens=2048, mode="paragraph", encoding="utf-8", checkpoint=None):
+        """``mode`` is ``"paragraph"`` to pack whole paragraphs into a chunk or ``"tokens"`` to cut at whitespace.
+
+        Paragraphs longer than ``chunk_tokens`` are cut at whitespace in both
+        modes. ``checkpoint`` is the path of a JSON file holding the resume
+        offset; None disables checkpointing.
+        """
+        if mode not in ("paragraph", "tokens"):
+            raise ValueError(f"Unknown chunking mode: {mode!r}")
+        self.path = path
+        self.chunk_tokens = chunk_tokens
+        self.mode = mode
+        self.encoding = encoding
+        self.checkpoint = checkpoint
+        self.offset = 0  # Byte offset the next run starts from
+        self.next_index = 0
+        if checkpoint:
+            self._load_checkpoint()
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path)
+
+    @property
+    def text(self):
+        """The whole file as a string, for files small enough to pass to a node at once."""
+        with open(self.path, "rb") as f:
+            return f.read().decode(self.encoding, errors="replace")
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable checkpoint %s: %s", self.checkpoint, e)
+            return
+        if state.get("path") != os.path.abspath(self.path) or state.get("offset", 0) > self.size:
+            logger.warning("Checkpoint %s is for another file or an older version of it, starting over",
+                           self.checkpoint)
+            return
+        self.offset = state["offset"]
+        self.next_index = state.get("chunks", 0)
+        logger.info("Resuming %s at byte %d of %d (chunk %d)", self.path, self.offset, self.size, self.next_index)
+
+    def save_checkpoint(self, offset, next_index):
+        """Record that everything before byte ``offset`` is done."""
+        self.offset = offset
+        self.next_index = next_index
+        if not self.checkpoint:
+            return
+        state = {"path": os.path.abspath(self.path), "offset": offset, "chunks": next_index, "size": self.size}
+        temporary = f"{self.checkpoint}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(state, f)
+        # Atomic, so an interruption never leaves a half-written checkpoint
+        os.replace(temporary, self.checkpoint)
+
+    def reset(self):
+        """Start the next run from the beginning of the file."""
+        self.save_checkpoint(0, 0)
+
+    def _chunk_end(self, data, start, size):
+        limit = start + self.chunk_tokens * BYTES_PER_TOKEN
+        if limit >= size:
+            return size
+        if self.mode == "paragraph":
+            end = None
+            for match in PARAGRAPH_BREAK.finditer(data, start, limit):
+                end = match.end()
+            if end is not None:
+                return end
+        cut = max(data.rfind(b" ", start, limit), data.rfind(b"\n", start, limit))
+        if cut > start:
+            return cut + 1
+        # No whitespace at all; back up to the start of a UTF-8 character
+        while limit > start + 1 and data[limit] & 0xC0 == 0x80:
+            limit -= 1
+        return limit
+
+    def chunks(self, start=None):
+        """Yield ``Chunk`` tuples lazily, starting at byte ``start`` (the resume offset when None)."""
+        start = self.offset if start is None else start
+        index = self.next_index if start == self.offset else 0
+        size = self.size
+        if start >= size:
+            return
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            while start < size:
+                end = self._chunk_end(data, start, size)
+                text = data[start:end].decode(self.encoding, errors="replace").strip()
+                if text:
+                    yield Chunk(index, start, end, text)
+                    index += 1
+                start = end
+
+    def __iter__(self):
+        return (chunk.text for chunk in self.chunks())
+
+    def process(self, node, concurrency=4, max_tokens=None):
+        """Stream the chunks through ``node.imap``, yielding a ``MapResult`` per chunk in file order.
+
+        Each result's ``index`` is the chunk's index in the file and its
+        ``input`` is the ``Chunk``. The checkpoint advances after the caller
+        has consumed a result; it stops at the first failed chunk, so a
+        resumed run retries from there.
+        """
+        in_flight = deque()
+
+        def texts():
+            for chunk in self.chunks():
+                in_flight.append(chunk)
+                yield chunk.text
+
+        failed = False
+        for result in node.imap(texts(), concurrency=concurrency, ordered=True, max_tokens=max_tokens):
+            chunk = in_flight.popleft()
+            yield result._replace(index=chunk.index, input=chunk)
+            failed = failed or not result.ok
+            if not failed:
+                self.save_checkpoint(chunk.end, chunk.index + 1)
+        if not failed:
+            # Trailing whitespace produces no chunk; mark the whole file as done
+            self.save_checkpoint(self.size, self.next_index)
@@ -0,0 +1,14 @@
+class OllamaError(Exception):
+    pass
+
+
+class PromptTooLongError(OllamaError):
+    pass
+
+
+class OllamaUnavailableError(OllamaError):
+    pass
+
+
+class CircuitOpenError(OllamaUnavailableError):
+    pass
@@ -0,0 +1,215 @@
+"""HTML-to-text extraction for Website sources.
+
+The default ``article`` extractor streams the page through lxml's parser
+when lxml is installed and through the standard library's ``html.parser``
+otherwise; neither builds a tree. It collects text blocks (paragraphs,
+headings, list items, ...), drops scripts, styles, navigation, headers,
+footers, sidebars and elements whose class or id marks them as boilerplate,
+keeps only ``<article>``/``<main>`` content when the page has any, and removes
+link-heavy and very short blocks. The ``soup`` extractor is the previous
+behaviour: BeautifulSoup's ``get_text()`` of the whole page.
+
+Extractors are plain callables ``html -> Extraction``; add your own with
+``register_extractor`` and select one per Website or with ``set_extractor``.
+"""
+import logging
+import re
+from html.parser import HTMLParser
+
+from .tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+INVISIBLE_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "head"}
+SKIP_TAGS = INVISIBLE_TAGS | {"form", "button", "select", "nav", "header", "footer", "aside"}
+BLOCK_TAGS = {"p", "h1", "h2", "h3", "h4", "h5", "h6", "li", "blockquote", "pre", "td", "th", "dd", "dt",
+              "figcaption", "div", "section", "article", "main", "ul", "ol", "table", "tr", "br", "hr", "body"}
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+BOILERPLATE = re.compile(r"(?:^|[\s_-])(nav|navbar|menu|footer|header|sidebar|comments?|share|sharing|social|ads?|"
+                         r"advert\w*|sponsor\w*|promo\w*|cookie\w*|related|breadcrumbs?|subscribe|newsletter|"
+                         r"popup|modal|banner|widget)(?:$|[\s_-])", re.IGNORECASE)
+WHITESPACE = re.compile(r"\s+")
+
+
+class Extraction:
+    def __init__(self, text, page_chars, model_name=None):
+        self.text = text
+        self.page_chars = page_chars
+        self.text_chars = len(text)
+        self.model_name = model_name
+
+    @property
+    def reduction(self):
+        """Fraction of the page's visible text that was dropped."""
+        return 1 - self.text_chars / self.page_chars if self.page_chars else 0.0
+
+    def token_counts(self, page_text=None):
+        """``(page_tokens, text_tokens)``; the page count is estimated from its length unless given the text."""
+        text_tokens = count_tokens(self.text, self.model_name)
+        if page_text is not None:
+            return count_tokens(page_text, self.model_name), text_tokens
+        return round(text_tokens * self.page_chars / self.text_chars) if self.text_chars else 0, text_tokens
+
+
+class _BlockCollector:
+    """Splits a page into text blocks; works as an lxml parser target and behind ``_StdlibParser``."""
+
+    def __init__(self):
+        self.blocks = []  # (text, link_chars, tag, in_main)
+        self.page_chars = 0  # Visible text including boilerplate, whitespace collapsed
+        self._stack = []  # (tag, skips, is_main, is_link)
+        self._skip = 0
+        self._invisible = 0
+        self._main = 0
+        self._link = 0
+        self._parts = []
+        self._link_chars = 0
+        self._block_tag = "body"
+
+    def _flush(self):
+        if self._parts:
+            text = WHITESPACE.sub(" ", "".join(self._parts)).strip()
+            if text:
+                self.page_chars += len(text) + 2
+                self.blocks.append((text, self._link_chars, self._block_tag, self._main > 0))
+        self._parts = []
+        self._link_chars = 0
+
+    def start(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._flush()
+            self._block_tag = tag
+        if tag in VOID_TAGS:
+            return
+        attrs = dict(attrs)
+        marker = f"{attrs.get('class') or ''} {attrs.get('id') or ''} {attrs.get('role') or ''}"
+        skips = tag in SKIP_TAGS or (tag not in ("body", "html", "main", "article") and bool(BOILERPLATE.search(marker)))
+        is_main = tag in ("article", "main") or attrs.get("role") == "main"
+        is_link = tag == "a"
+        self._stack.append((tag, skips, is_main, is_link))
+        self._skip += skips
+        self._invisible += tag in INVISIBLE_TAGS
+        self._main += is_main
+        self._link += is_link
+
+    def end(self, tag):
+        # Unclosed elements are closed with their parent, stray end tags are ignored
+        if tag in VOID_TAGS or not any(entry[0] == tag for entry in self._stack):
+            return
+        while self._stack:
+            open_tag, skips, is_main, is_link = self._stack.pop()
+            if open_tag in BLOCK_TAGS:
+                self._flush()
+            self._skip -= skips
+            self._invisible -= open_tag in INVISIBLE_TAGS
+            self._main -= is_main
+            self._link -= is_link
+            if open_tag == tag:
+                break
+
+    def data(self, text):
+        if self._skip:
+            # Boilerplate still counts towards the page's text, scripts and styles don't
+            if not self._invisible:
+                self.page_chars += len(WHITESPACE.sub(" ", text).strip()) + 1
+            return
+        self._parts.append(text)
+        if self._link:
+            self._link_chars += len(text.strip())
+
+    def close(self):
+        self._flush()
+        return self
+
+
+class _StdlibParser(HTMLParser):
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        self.collector.start(tag, attrs)
+        self.collector.end(tag)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+
+def _select(blocks, min_words, max_link_density):
+    if any(in_main for _, _, _, in_main in blocks):
+        blocks = [block for block in blocks if block[3]]
+    kept = []
+    for text, link_chars, tag, _ in blocks:
+        if link_chars / len(text) > max_link_density:
+            continue
+        if tag not in HEADING_TAGS and len(text.split()) < min_words:
+            continue
+        kept.append(text)
+    return "\n\n".join(kept)
+
+
+def _collect(html):
+    collector = _BlockCollector()
+    try:
+        from lxml import etree
+    except ImportError:
+        parser = _StdlibParser(collector)
+        parser.feed(html)
+        parser.close()
+        return collector.close()
+    parser = etree.HTMLParser(target=collector, remove_comments=True)
+    parser.feed(html)
+    return parser.close()
+
+
+def article_extractor(html, min_words=6, max_link_density=0.5, model_name=None):
+    collector = _collect(html)
+    text = _select(collector.blocks, min_words, max_link_density)
+    if not text:
+        # Nothing passed the filters (a very short page); fall back to all visible text
+        text = "\n\n".join(block[0] for block in collector.blocks)
+    return Extraction(text, collector.page_chars, model_name)
+
+
+def soup_extractor(html, model_name=None):
+    from bs4 import BeautifulSoup
+
+    text = BeautifulSoup(html, "html.parser").get_text()
+    return Extraction(text, len(text), model_name)
+
+
+_extractors = {"article": article_extractor, "soup": soup_extractor}
+_default = "article"
+
+
+def register_extractor(name, extractor):
+    """Make ``extractor(html) -> Extraction`` available by ``name``."""
+    _extractors[name] = extractor
+
+
+def set_extractor(extractor):
+    """Use ``extractor`` (a registered name or a callable) for every Website without its own."""
+    global _default
+    _default = extractor
+
+
+def get_extractor(extractor=None):
+    extractor = extractor or _default
+    return _extractors[extractor] if isinstance(extractor, str) else extractor
+
+
+def extract(html, extractor=None):
+    """Extract the text of ``html`` and log how much of the page was dropped."""
+    extraction = get_extractor(extractor)(html)
+    if logger.isEnabledFor(logging.INFO):
+        page_tokens, text_tokens = extraction.token_counts()
+        logger.info("Extracted %d of %d characters (%.0f%% less, about %d instead of %d tokens)",
+                    extraction.text_chars, extraction.page_chars, extraction.reduction * 100, text_tokens, page_tokens)
+    return extraction
@@ -0,0 +1,354 @@
+"""A stand-in Ollama server for benchmarks and development without a GPU.
+
+Serves ``/api/generate``, ``/api/chat``, ``/api/version`` and ``/api/tags``
+with a configurable time to first token, generation speed and number of
+parallel slots, a per-slot prompt cache like Ollama's (a prompt sharing a
+prefix with an earlier prompt and its response only counts the rest in
+``prompt_eval_count``), optional error injection, and deterministic responses: canned
+ones, a hash-derived filler text, or responses replayed from a file recorded
+against a real server.
+
+    python -m virtworker.fakeserver --port 11500 --ttft 0.2 --tokens-per-second 40 --parallel 2
+    VIRTWORKER_OLLAMA_URL=http://127.0.0.1:11500 python my_script.py
+
+or in-process:
+
+    with FakeOllama(ttft=0.1) as server:
+        virtworker.set_default_url(server.url)
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+NANOSECONDS = 1e9
+WORDS = ("the", "model", "answer", "quick", "token", "story", "river", "light", "signal", "garden",
+         "engine", "north", "paper", "window", "silver", "echo", "harbor", "winter", "field", "voice")
+
+
+def response_key(model, prompt):
+    return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+def filler_text(model, prompt, num_tokens):
+    """Deterministic text of ``num_tokens`` words derived from the model and prompt."""
+    digest = hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).digest()
+    return " ".join(WORDS[digest[i % len(digest)] % len(WORDS)] for i in range(num_tokens))
+
+
+def chat_prompt(messages):
+    return "\n".join(f"{m.get('role', 'user')}: {m.get('content', '')}" for m in messages)
+
+
+class FakeOllama:
+    def __init__(self, host="127.0.0.1", port=0, ttft=0.05, tokens_per_second=50.0, parallel=1,
+                 response_tokens=32, models=("llama3",), responses=None, error_rate=0.0, error_status=500,
+                 replay=None, record=None, upstream=None, seed=0):
+        """
+        ``responses`` maps a prompt to a canned response (or is a callable
+        taking the request body). ``replay`` is a JSONL file of recorded
+        responses; with ``record`` set, prompts missing from it are forwarded
+        to ``upstream`` and the answers appended to ``record``.
+        """
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.models = list(models)
+        self.responses = responses or {}
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.upstream = upstream.rstrip("/") if upstream else None
+        self.record = record
+        self._slots = threading.Semaphore(parallel)
+        self.parallel = parallel
+        self._prompt_cache = []  # (model, prompt + response) per slot, least recently used first
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._fail_next = []
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self.recorded = {}
+        self._connections = set()  # Open client sockets, closed by stop()
+        if replay:
+            self.load_recording(replay)
+        if record and os.path.exists(record):
+            self.load_recording(record)
+        handler = type("Handler", (_Handler,), {"fake": self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop listening and drop every open connection, like a server that went away."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass  # Already closed by the client
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def fail_next(self, count=1, status=None):
+        """Make the next ``count`` generate/chat requests fail with ``status``."""
+        with self._lock:
+            self._fail_next.extend([status or self.error_status] * count)
+
+    def load_recording(self, path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.recorded[response_key(entry["model"], entry["prompt"])] = entry["response"]
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = 0
+            self.max_active = 0
+
+    def _injected_error(self):
+        with self._lock:
+            if self._fail_next:
+                return self._fail_next.pop(0)
+            if self.error_rate and self._random.random() < self.error_rate:
+                return self.error_status
+        return None
+
+    def _forward(self, model, prompt, body):
+        chat = "messages" in body
+        response = requests.post(f"{self.upstream}/api/{'chat' if chat else 'generate'}",
+                                 json=dict(body, stream=False), timeout=600)
+        response.raise_for_status()
+        data = response.json()
+        text = data["message"]["content"] if chat else data["response"]
+        with self._lock:
+            self.recorded[response_key(model, prompt)] = text
+            with open(self.record, "a") as f:
+                f.write(json.dumps({"model": model, "prompt": prompt, "response": text}) + "\n")
+        return text
+
+    def prompt_eval_count(self, model, prompt, response):
+        """Tokens evaluated for ``prompt``, reusing the slot that holds the longest common prefix.
+
+        Tokens are estimated at four characters each.
+        """
+        with self._lock:
+            best = None
+            reused = 0
+            for index, (cached_model, cached) in enumerate(self._prompt_cache):
+                if cached_model == model:
+                    common = len(os.path.commonprefix([cached, prompt]))
+                    if common > reused:
+                        best, reused = index, common
+            if best is not None:
+                del self._prompt_cache[best]
+            elif len(self._prompt_cache) >= self.parallel:
+                del self._prompt_cache[0]
+            self._prompt_cache.append((model, prompt + response))
+        return (len(prompt) - reused) // 4 + 1
+
+    def response_for(self, model, prompt, body):
+        canned = self.responses(body) if callable(self.responses) else self.responses.get(prompt)
+        if canned is not None:
+            return canned
+        key = response_key(model, prompt)
+        if key in self.recorded:
+            return self.recorded[key]
+        if self.record and self.upstream:
+            return self._forward(model, prompt, body)
+        num_tokens = min(self.response_tokens, body.get("options", {}).get("num_predict") or self.response_tokens)
+        return filler_text(model, prompt, num_tokens)
+
+    def begin(self):
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+    def end(self):
+        with self._lock:
+            self.active -= 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, each response waits for a delayed ACK
+    disable_nagle_algorithm = True
+    fake = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.fake._lock:
+            self.fake._connections.add(self.connection)
+
+    def finish(self):
+        with self.fake._lock:
+            self.fake._connections.discard(self.connection)
+        super().finish()
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_chunk(self, payload):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self._send_json(200, {"version": "0.0.0-fake"})
+        elif self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": name if ":" in name else f"{name}:latest", "model": name}
+                                             for name in self.fake.models]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path not in ("/api/generate", "/api/chat"):
+            self._send_json(404, {"error": "not found"})
+            return
+        chat = self.path == "/api/chat"
+        model = body.get("model", "")
+        if self.fake.models and model not in self.fake.models and f"{model}:latest" not in self.fake.models:
+            self._send_json(404, {"error": f"model '{model}' not found"})
+            return
+        prompt = chat_prompt(body.get("messages", [])) if chat else body.get("prompt")
+        if not prompt:
+            # A request without a prompt only loads the model
+            self._send_json(200, {"model": model, "response": "", "done": True, "done_reason": "load"})
+            return
+        status = self.fake._injected_error()
+        if status is not None:
+            self._send_json(status, {"error": "injected failure"})
+            return
+
+        self.fake._slots.acquire()
+        self.fake.begin()
+        try:
+            self._generate(model, prompt, body, chat)
+        finally:
+            self.fake.end()
+            self.fake._slots.release()
+
+    def _generate(self, model, prompt, body, chat):
+        fake = self.fake
+        start = time.perf_counter()
+        try:
+            text = fake.response_for(model, prompt, body)
+        except requests.RequestException as e:
+            self._send_json(502, {"error": f"upstream failed: {e}"})
+            return
+        tokens = text.split(" ")
+        per_token = 1.0 / fake.tokens_per_second if fake.tokens_per_second else 0.0
+        time.sleep(fake.ttft)
+        prompt_time = time.perf_counter() - start
+
+        def piece(i):
+            return tokens[i] if i == 0 else " " + tokens[i]
+
+        prompt_tokens = fake.prompt_eval_count(model, prompt, text)
+
+        def final():
+            total = time.perf_counter() - start
+            stats = {
+                "model": model, "done": True, "done_reason": "stop",
+                "total_duration": int(total * NANOSECONDS), "load_duration": 0,
+                "prompt_eval_count": prompt_tokens, "prompt_eval_duration": int(prompt_time * NANOSECONDS),
+                "eval_count": len(tokens), "eval_duration": int((total - prompt_time) * NANOSECONDS),
+            }
+            # Like Ollama: raw prompts neither use a request's context nor return one
+            if not chat and not body.get("raw"):
+                stats["context"] = list(range(len(body.get("context") or ()) + prompt_tokens + len(tokens)))
+            return stats
+
+        if body.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(len(tokens)):
+                if i:
+                    time.sleep(per_token)
+                content = piece(i)
+                self._send_chunk({"model": model, "message": {"role": "assistant", "content": content}, "done": False}
+                                 if chat else {"model": model, "response": content, "done": False})
+            last = final()
+            last.update({"message": {"role": "assistant", "content": ""}} if chat else {"response": ""})
+            self._send_chunk(last)
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            time.sleep(per_token * (len(tokens) - 1))
+            result = final()
+            result.update({"message": {"role": "assistant", "content": text}} if chat else {"response": text})
+            self._send_json(200, result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--ttft", type=float, default=0.05, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--parallel", type=int, default=1, help="Requests generated at the same time")
+    parser.add_argument("--response-tokens", type=int, default=32)
+    parser.add_argument("--model", action="append", dest="models", help="Model to serve (repeatable)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--replay", help="JSONL file of recorded responses")
+    parser.add_argument("--record", help="Append responses fetched from --upstream to this JSONL file")
+    parser.add_argument("--upstream", help="Real Ollama server to record from")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = FakeOllama(args.host, args.port, ttft=args.ttft, tokens_per_second=args.tokens_per_second,
+                        parallel=args.parallel, response_tokens=args.response_tokens,
+                        models=args.models or ("llama3",), error_rate=args.error_rate,
+                        error_status=args.error_status, replay=args.replay, record=args.record,
+                        upstream=args.upstream, seed=args.seed)
+    print(f"Fake Ollama listening on {server.url}")
+    print(f"Point virtworker at it with: export VIRTWORKER_OLLAMA_URL={server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Process-wide cache of parsed RSS/Atom feeds.
+
+Every ``Website(use_rss=True)`` pointing at the same feed shares one
+download and one parse per ``ttl`` seconds, and looks its article up in a
+link index instead of scanning the entries. Feeds are downloaded through the
+shared ``Fetcher``, so a refresh of an unchanged feed is a conditional
+request, and an unchanged body is not parsed again.
+"""
+import hashlib
+import logging
+import threading
+import time
+
+from .fetch import get_fetcher
+
+logger = logging.getLogger(__name__)
+
+
+class Feed:
+    def __init__(self, url, parsed, digest, fetched_at):
+        self.url = url
+        self.parsed = parsed
+        self.digest = digest
+        self.fetched_at = fetched_at
+        self.entries = list(parsed.entries)
+        self.by_link = {}
+        for entry in self.entries:
+            link = entry.get("link")
+            if link and link not in self.by_link:
+                self.by_link[link] = entry
+
+    def entry(self, link):
+        return self.by_link.get(link)
+
+
+class FeedCache:
+    def __init__(self, ttl=300.0):
+        self.ttl = ttl
+        self._feeds = {}
+        self._lock = threading.Lock()
+        self._url_locks = {}
+        self.hits = 0
+        self.refreshes = 0
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def get(self, url):
+        """Return the ``Feed`` for ``url``, downloading and parsing it at most once per ``ttl``.
+
+        Concurrent callers asking for the same feed wait for one download.
+        """
+        feed = self._feeds.get(url)
+        if feed is not None and time.time() - feed.fetched_at < self.ttl:
+            self.hits += 1
+            return feed
+        with self._url_lock(url):
+            feed = self._feeds.get(url)
+            if feed is not None and time.time() - feed.fetched_at < self.ttl:
+                self.hits += 1
+                return feed
+            import feedparser
+
+            logger.info("Fetching content from RSS feed: %s", url)
+            if url.startswith(("http://", "https://")):
+                content = get_fetcher().fetch(url).content
+            else:
+                # Local files, as feedparser.parse would read them
+                with open(url, "rb") as f:
+                    content = f.read()
+            digest = hashlib.sha256(content).hexdigest()
+            if feed is not None and feed.digest == digest:
+                feed.fetched_at = time.time()
+            else:
+                feed = Feed(url, feedparser.parse(content), digest, time.time())
+            self.refreshes += 1
+            self._feeds[url] = feed
+            return feed
+
+    def entries(self, url):
+        return self.get(url).entries
+
+    def entry(self, url, link):
+        return self.get(url).entry(link)
+
+    def invalidate(self, url=None):
+        with self._lock:
+            if url is None:
+                self._feeds.clear()
+            else:
+                self._feeds.pop(url, None)
+
+
+feed_cache = FeedCache()
+
+
+def feed_entries(url):
+    """All entries of the feed at ``url``, from the shared cache."""
+    return feed_cache.entries(url)
@@ -0,0 +1,289 @@
+"""HTTP fetching for Website sources.
+
+A ``Fetcher`` owns a pooled keep-alive ``requests.Session`` with timeouts
+and asks for compressed responses (gzip and deflate, and brotli when the
+``brotli`` package is installed). With a ``FetchCache`` every page is stored
+with its ``ETag`` and ``Last-Modified`` headers and refetched with a
+conditional request, so an unchanged page costs a ``304 Not Modified`` instead
+of a full download.
+
+The cache is a SQLite file capped at ``max_bytes`` of (zlib-compressed)
+bodies; the least recently used pages are evicted first. The default fetcher
+keeps it in ``$XDG_CACHE_HOME/virtworker/fetch.sqlite``; set
+``VIRTWORKER_FETCH_CACHE`` to another path, or to an empty string to disable
+it.
+"""
+import contextvars
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_AGENT = "virtworker (+https://github.com/ruapotato/VirtWorker)"
+
+
+class FetchResult(namedtuple("FetchResult", "index source value error")):
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def default_cache_path():
+    path = os.environ.get("VIRTWORKER_FETCH_CACHE")
+    if path is not None:
+        return path or None
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "virtworker", "fetch.sqlite")
+
+
+class CachedPage:
+    def __init__(self, url, content, encoding, etag=None, last_modified=None, fetched_at=None):
+        self.url = url
+        self.content = content
+        self.encoding = encoding
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+
+class FetchCache:
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("""CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                encoding TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL)""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at)")
+            self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    def get(self, url):
+        with self._lock:
+            row = self._db.execute("SELECT body, encoding, etag, last_modified, fetched_at FROM pages WHERE url = ?",
+                                   (url,)).fetchone()
+        if row is None:
+            return None
+        body, encoding, etag, last_modified, fetched_at = row
+        return CachedPage(url, zlib.decompress(body), encoding, etag, last_modified, fetched_at)
+
+    def touch(self, url, fetched_at=None):
+        """Count a hit on ``url``, or a successful revalidation when ``fetched_at`` is given."""
+        with self._lock, self._db:
+            if fetched_at is None:
+                self.hits += 1
+                self._db.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            else:
+                self.revalidated += 1
+                self._db.execute("UPDATE pages SET accessed_at = ?, fetched_at = ? WHERE url = ?",
+                                 (time.time(), fetched_at, url))
+
+    def set(self, page):
+        body = zlib.compress(page.content)
+        if len(body) > self.max_bytes:
+            logger.debug("Not caching %s, %d bytes is over the cache size", page.url, len(body))
+            return
+        now = time.time()
+        with self._lock, self._db:
+            self.misses += 1
+            old = self._db.execute("SELECT size FROM pages WHERE url = ?", (page.url,)).fetchone()
+            self._db.execute("""INSERT OR REPLACE INTO pages
+                (url, body, size, encoding, etag, last_modified, fetched_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                             (page.url, body, len(body), page.encoding, page.etag, page.last_modified,
+                              page.fetched_at or now, now))
+            self._size += len(body) - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Caller holds self._lock inside a transaction
+        freed = 0
+        excess = self._size - self.max_bytes
+        victims = []
+        for url, size in self._db.execute("SELECT url, size FROM pages ORDER BY accessed_at"):
+            if freed >= excess:
+                break
+            victims.append((url,))
+            freed += size
+        self._db.executemany("DELETE FROM pages WHERE url = ?", victims)
+        self._size -= freed
+        logger.debug("Evicted %d pages (%d bytes) from the fetch cache", len(victims), freed)
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM pages")
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        return {"hits": self.hits, "revalidated": self.revalidated, "misses": self.misses,
+                "entries": entries, "bytes": self._size}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class Fetcher:
+    def __init__(self, cache=None, connect_timeout=5.0, read_timeout=30.0, pool_size=16, max_age=0,
+                 user_agent=DEFAULT_USER_AGENT):
+        """``max_age`` is how many seconds a cached page is used without asking the server at all."""
+        self.cache = cache
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_age = max_age
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # urllib3 adds "br" when a brotli decoder is installed
+        self.session.headers.update(make_headers(accept_encoding=True))
+        self.session.headers["User-Agent"] = user_agent
+
+    def fetch(self, url):
+        """Return the ``CachedPage`` for ``url``, from the cache when the server says it is unchanged.
+
+        Raises ``requests.RequestException`` on network errors.
+        """
+        cached = self.cache.get(url) if self.cache is not None else None
+        headers = {}
+        if cached is not None:
+            if self.max_age and time.time() - cached.fetched_at < self.max_age:
+                self.cache.touch(url)
+                return cached
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        response = self.session.get(url, headers=headers, timeout=(self.connect_timeout, self.read_timeout))
+        if cached is not None and response.status_code == 304:
+            logger.debug("Not modified: %s", url)
+            self.cache.touch(url, fetched_at=time.time())
+            return cached
+        page = CachedPage(url, response.content, response.encoding or response.apparent_encoding,
+                          response.headers.get("ETag"), response.headers.get("Last-Modified"), time.time())
+        if response.status_code != 200:
+            # Error pages are returned like before but never cached
+            logger.warning("Fetching %s returned %d", url, response.status_code)
+        elif self.cache is not None:
+            self.cache.set(page)
+        return page
+
+    def fetch_text(self, url):
+        return self.fetch(url).text
+
+    def fetch_many(self, urls, concurrency=16, per_host=2, host_delay=0.5):
+        """Fetch ``urls`` concurrently, yielding a ``FetchResult`` with the page as each one completes."""
+        return polite_map(self.fetch, urls, lambda url: url, concurrency, per_host, host_delay)
+
+    def close(self):
+        self.session.close()
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher():
+    """Return the shared fetcher, creating it with the default cache on first use."""
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            path = default_cache_path()
+            _fetcher = Fetcher(FetchCache(path) if path else None)
+        return _fetcher
+
+
+def set_fetcher(fetcher):
+    """Use ``fetcher`` for every Website; None goes back to the default on next use."""
+    global _fetcher
+    with _fetcher_lock:
+        _fetcher = fetcher
+
+
+def host_of(url):
+    return urlsplit(url).netloc.lower()
+
+
+def polite_map(func, sources, url_of, concurrency=16, per_host=2, host_delay=0.5):
+    """Call ``func(source)`` for every source in worker threads, yielding ``FetchResult`` as they finish.
+
+    At most ``per_host`` calls run against one host at a time and calls to
+    the same host start at least ``host_delay`` seconds apart. Waiting hosts
+    never hold a worker: the other hosts keep all ``concurrency`` workers busy.
+    Failures are reported through ``FetchResult.error``.
+    """
+    queues = OrderedDict()
+    for index, source in enumerate(sources):
+        queues.setdefault(host_of(url_of(source)), deque()).append((index, source))
+    active = Counter()
+    next_start = {}
+    pending = {}
+
+    def run_one(index, source):
+        try:
+            return FetchResult(index, source, func(source), None)
+        except Exception as e:
+            return FetchResult(index, source, None, e)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while queues or pending:
+            now = time.monotonic()
+            for host in list(queues):
+                if len(pending) >= concurrency:
+                    break
+                if active[host] >= per_host or now < next_start.get(host, 0.0):
+                    continue
+                index, source = queues[host].popleft()
+                active[host] += 1
+                next_start[host] = now + host_delay
+                pending[executor.submit(contextvars.copy_context().run, run_one, index, source)] = host
+                if queues[host]:
+                    # Rotate so that one busy host does not starve the others
+                    queues.move_to_end(host)
+                else:
+                    del queues[host]
+
+            # Wake up when the next host with a free slot is out of its politeness delay
+            delayed = [next_start[host] for host in queues if active[host] < per_host and host in next_start]
+            timeout = max(0.0, min(delayed) - now) if delayed and len(pending) < concurrency else None
+            if not pending:
+                time.sleep(timeout or 0.0)
+                continue
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                active[pending.pop(future)] -= 1
+                result = future.result()
+                if result.error is not None:
+                    logger.warning("Fetching %s failed: %s", url_of(result.source), result.error)
+                yield result
@@ -0,0 +1,28 @@
+import logging
+
+from .errors import OllamaUnavailableError
+from .transport import get_transport
+
+logger = logging.getLogger(__name__)
+
+
+def check_ollama():
+    try:
+        response = get_transport().get('/api/version')
+        if response.status_code == 200:
+            logger.info("Ollama is running.")
+            return True
+        else:
+            logger.error("Ollama is not responding correctly.")
+            return False
+    except OllamaUnavailableError:
+        logger.error("Ollama is not running. Please start Ollama with 'ollama serve'.")
+        return False
+
+
+def ensure_ollama():
+    """Check once that the default Ollama endpoint is reachable.
+
+    Raises OllamaUnavailableError if it is not; see Transport.ensure_healthy.
+    """
+    get_transport().ensure_healthy()
@@ -0,0 +1,89 @@
+"""Logging helpers.
+
+virtworker logs through the standard ``logging`` module under the
+``virtworker`` logger and never configures handlers on import. Node messages
+go to ``virtworker.node.<node name>``, so each node's level can be set on its
+own (``node.set_log_level("WARNING")``).
+
+Prompts and responses are wrapped in ``Payload`` so that they are only
+formatted when a record is actually emitted, and are cut to
+``max_payload_chars`` with a hash of the full text when they are longer.
+"""
+import atexit
+import hashlib
+import logging
+import logging.handlers
+import queue
+import sys
+
+logger = logging.getLogger("virtworker")
+logger.addHandler(logging.NullHandler())
+
+# Longest prompt or response logged in full, None to never truncate
+max_payload_chars = 1000
+
+_listener = None
+_handler = None
+
+
+class Payload:
+    """Lazily truncated text for log messages."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+    def __str__(self):
+        text = str(self.text)
+        if max_payload_chars is None or len(text) <= max_payload_chars:
+            return text
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        return f"{text[:max_payload_chars]}... [{len(text)} chars, sha256 {digest}]"
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # The stock handler formats the message here, in the calling thread.
+        # Records never leave the process, so formatting is left to the listener.
+        return record
+
+
+def node_logger(name):
+    # Dots would make one node's logger the parent of another's
+    return logging.getLogger(f"virtworker.node.{name.replace('.', '_')}")
+
+
+def configure_logging(level=logging.INFO, stream=None, fmt="%(message)s", payload_chars=1000, use_queue=False):
+    """Send virtworker's log records to ``stream`` (stdout by default).
+
+    With ``use_queue`` the records are handed to a ``QueueHandler`` and
+    written by a background listener thread, so a slow terminal or file never
+    holds up a node call. Calling it again replaces the previous setup.
+    """
+    global max_payload_chars, _listener, _handler
+    max_payload_chars = payload_chars
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _handler is not None:
+        logger.removeHandler(_handler)
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(logging.Formatter(fmt))
+    if use_queue:
+        _handler = _DeferredQueueHandler(queue.SimpleQueue())
+        _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_stop_listener)
+    else:
+        _handler = output
+    logger.addHandler(_handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,178 @@
+"""Map-reduce summarization for texts larger than a node's context window.
+
+``split_text`` cuts a text along its structure: at section headings, then
+between paragraphs, and only inside a paragraph (between sentences) when the
+paragraph alone does not fit. Where a chunk ends depends on the paragraphs
+around it rather than on everything before it, so an edit moves only the
+chunk boundaries near it.
+
+``MapReduceSummarizer`` summarizes the chunks in parallel, then summarizes
+groups of those summaries until a single summary is left. Every chunk and
+group summary is cached by its prompt, so summarizing an edited text again
+only calls the model for the chunks that changed and the groups above them.
+"""
+import contextvars
+import logging
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import ResponseCache, make_key
+from .tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+PARAGRAPH = re.compile(r"\n\s*\n")
+SENTENCE = re.compile(r"(?<=[.!?])\s+")
+SECTION = re.compile(r"(?:#{1,6}\s|(?:chapter|part|act|section)\s+\w+)", re.IGNORECASE)
+BOUNDARY_DIVISOR = 4  # After the minimum size, one paragraph in four ends a chunk
+
+CHUNK_INSTRUCTION = ("Summarize the following part of a longer text. Keep the key facts, names, numbers and "
+                     "events, and do not comment on the text itself.")
+COMBINE_INSTRUCTION = ("Combine these summaries of consecutive parts of one text into a single summary. Keep the "
+                       "key facts, names, numbers and events in their original order.")
+
+# Shared by every summarizer; keys include the model and the full prompt
+summary_cache = ResponseCache(max_memory_entries=4096)
+
+
+def _split_long(text, max_tokens, count):
+    """Split a paragraph that is over ``max_tokens`` between sentences, or between words as a last resort."""
+    pieces = []
+    for sentence in SENTENCE.split(text):
+        tokens = count(sentence)
+        if tokens <= max_tokens:
+            pieces.append(sentence)
+            continue
+        words = sentence.split()
+        step = max(1, len(words) * max_tokens // tokens)
+        pieces.extend(" ".join(words[i:i + step]) for i in range(0, len(words), step))
+    return [" ".join(group) for group in _pack(pieces, max_tokens, count, sections=False)]
+
+
+def _pack(units, max_tokens, count, max_units=None, sections=True):
+    """Group consecutive ``units`` into lists of at most ``max_tokens``.
+
+    Past half of ``max_tokens`` a group ends after any unit whose checksum is
+    divisible by ``BOUNDARY_DIVISOR``, and with ``sections`` a group also
+    ends before a heading, so the boundaries resynchronise shortly after an
+    inserted or removed unit.
+    """
+    min_tokens = max_tokens // 2
+    groups = []
+    group = []
+    size = 0
+    for unit in units:
+        tokens = count(unit)
+        if group and (size + tokens > max_tokens or (max_units and len(group) >= max_units)
+                      or (sections and size >= min_tokens // 2 and SECTION.match(unit))):
+            groups.append(group)
+            group = []
+            size = 0
+        group.append(unit)
+        size += tokens
+        if size >= min_tokens and zlib.crc32(unit.encode("utf-8")) % BOUNDARY_DIVISOR == 0:
+            groups.append(group)
+            group = []
+            size = 0
+    if group:
+        groups.append(group)
+    return groups
+
+
+def split_text(text, max_tokens, count=count_tokens):
+    """Split ``text`` into chunks of at most about ``max_tokens`` tokens along sections and paragraphs."""
+    units = []
+    for paragraph in PARAGRAPH.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count(paragraph) <= max_tokens:
+            units.append(paragraph)
+        else:
+            units.extend(_split_long(paragraph, max_tokens, count))
+    return ["\n\n".join(group) for group in _pack(units, max_tokens, count)]
+
+
+def default_chunk_tokens(node, limit=4096):
+    """Chunk size that leaves room in the node's context window for its definition and the response."""
+    window = node.num_ctx or node.max_num_ctx
+    overhead = count_tokens(node.definition or "", node.model_name) + 256
+    return max(256, min(limit, window - node.response_reserve - overhead))
+
+
+class MapReduceSummarizer:
+    def __init__(self, node, chunk_tokens=None, fan_in=8, concurrency=4, cache=None, max_tokens=None,
+                 instruction=CHUNK_INSTRUCTION, combine_instruction=COMBINE_INSTRUCTION):
+        """Summarize texts of any length with ``node``.
+
+        Chunks are at most ``chunk_tokens`` long (sized from the node's
+        context window when None) and at most ``fan_in`` summaries are
+        combined per call. The final call sends the combined summaries
+        without an instruction, so the node's definition decides what the
+        summary looks like.
+        """
+        self.node = node
+        self.chunk_tokens = chunk_tokens or default_chunk_tokens(node)
+        self.fan_in = max(2, fan_in)
+        self.concurrency = concurrency
+        self.cache = cache if cache is not None else summary_cache
+        self.max_tokens = max_tokens or getattr(node, 'max_tokens', 8192)
+        self.instruction = instruction
+        self.combine_instruction = combine_instruction
+
+    def _count(self, text):
+        return count_tokens(text, self.node.model_name)
+
+    def split(self, text):
+        return split_text(text, self.chunk_tokens, self._count)
+
+    def _run(self, input_text):
+        # A fresh context like Node.map; the prompt includes the definition, so it is part of the key
+        prompt = self.node._build_prompt(input_text, context=[])
+        key = make_key(self.node.model_name, prompt, {"num_predict": self.max_tokens})
+        return self.cache.get_or_compute(key, lambda: self.node._generate(prompt, self.max_tokens))
+
+    def _run_all(self, inputs):
+        if len(inputs) == 1:
+            return [self._run(inputs[0])]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            # Each call runs in a copy of the caller's context so token usage tracking and tracing follow it
+            futures = [executor.submit(contextvars.copy_context().run, self._run, input_text)
+                       for input_text in inputs]
+            return [future.result() for future in futures]
+
+    def map(self, text, instruction=None):
+        """Run ``instruction`` followed by each chunk of ``text`` through the node, returning the outputs in order."""
+        instruction = self.instruction if instruction is None else instruction
+        chunks = self.split(text)
+        logger.info("[%s] Processing %d chunks of up to %d tokens", self.node.name, len(chunks), self.chunk_tokens)
+        return self._run_all([f"{instruction}\n\n{chunk}" if instruction else chunk for chunk in chunks])
+
+    def summarize(self, text):
+        """Return the summary of ``text``; raises like ``Node._generate`` when a call fails."""
+        chunks = self.split(text)
+        if len(chunks) <= 1:
+            # Fits in one call, exactly like calling the node with a fresh context
+            return self._run(chunks[0] if chunks else text)
+        logger.info("[%s] Summarizing %d chunks of up to %d tokens", self.node.name, len(chunks), self.chunk_tokens)
+        summaries = self._run_all([f"{self.instruction}\n\n{chunk}" for chunk in chunks])
+        while True:
+            groups = _pack(summaries, self.chunk_tokens, self._count, self.fan_in, sections=False)
+            if len(groups) == 1:
+                return self._run("\n\n".join(groups[0]))
+            if len(groups) >= len(summaries):
+                # Summaries too long to pair up by size; combine fixed groups so every level shrinks
+                groups = [summaries[i:i + self.fan_in] for i in range(0, len(summaries), self.fan_in)]
+            logger.info("[%s] Combining %d summaries in %d groups", self.node.name, len(summaries), len(groups))
+            summaries = self._run_all([f"{self.combine_instruction}\n\n" + "\n\n".join(group) for group in groups])
+
+
+def summarize(node, text, **kwargs):
+    """Summarize ``text`` with ``node`` however long it is; see ``MapReduceSummarizer`` for the options."""
+    return MapReduceSummarizer(node, **kwargs).summarize(text)
+
+
+def map_chunks(node, text, instruction, **kwargs):
+    """Apply ``node`` to each chunk of ``text`` (prefixed with ``instruction``) in parallel, in order."""
+    return MapReduceSummarizer(node, **kwargs).map(text, instruction)
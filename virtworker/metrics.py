@@ -0,0 +1,186 @@
+"""Per-call performance metrics from Ollama's response statistics.
+
+Every completed call reports ``total_duration``, ``load_duration``,
+``prompt_eval_count/duration`` and ``eval_count/duration``. The module-level
+``registry`` keeps them aggregated per node and per model: latency
+histograms, prefill and decode throughput, and how often a call had to wait
+for a model load. Read them in-process with ``virtworker.metrics.snapshot()``
+or write them for Prometheus' textfile collector with
+``virtworker.metrics.write_prometheus(path)``.
+"""
+import os
+import tempfile
+import threading
+
+NANOSECONDS = 1e9
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# Ollama reports a few milliseconds of load time even when the model is resident
+MODEL_LOAD_THRESHOLD = 0.5
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def quantile(self, q):
+        """Upper bucket bound below which a fraction ``q`` of observations fall."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= target:
+                return bound
+        return float("inf")
+
+
+class CallStats:
+    def __init__(self):
+        self.calls = 0
+        self.latency = Histogram()
+        self.load_time = 0.0
+        self.model_loads = 0
+        self.prompt_tokens = 0
+        self.prompt_time = 0.0
+        self.completion_tokens = 0
+        self.completion_time = 0.0
+
+    def record(self, data):
+        self.calls += 1
+        self.latency.observe(data.get("total_duration", 0) / NANOSECONDS)
+        load_time = data.get("load_duration", 0) / NANOSECONDS
+        self.load_time += load_time
+        if load_time >= MODEL_LOAD_THRESHOLD:
+            self.model_loads += 1
+        self.prompt_tokens += data.get("prompt_eval_count", 0)
+        self.prompt_time += data.get("prompt_eval_duration", 0) / NANOSECONDS
+        self.completion_tokens += data.get("eval_count", 0)
+        self.completion_time += data.get("eval_duration", 0) / NANOSECONDS
+
+    @property
+    def prefill_tokens_per_second(self):
+        return self.prompt_tokens / self.prompt_time if self.prompt_time else 0.0
+
+    @property
+    def decode_tokens_per_second(self):
+        return self.completion_tokens / self.completion_time if self.completion_time else 0.0
+
+    def summary(self):
+        return {
+            "calls": self.calls,
+            "total_seconds": self.latency.sum,
+            "p50_seconds": self.latency.quantile(0.5),
+            "p95_seconds": self.latency.quantile(0.95),
+            "load_seconds": self.load_time,
+            "model_loads": self.model_loads,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "prefill_tokens_per_second": self.prefill_tokens_per_second,
+            "decode_tokens_per_second": self.decode_tokens_per_second,
+        }
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_node = {}
+        self.by_model = {}
+
+    def record(self, node_name, model, data):
+        with self._lock:
+            self.by_node.setdefault(node_name, CallStats()).record(data)
+            self.by_model.setdefault(model, CallStats()).record(data)
+
+    def reset(self):
+        with self._lock:
+            self.by_node = {}
+            self.by_model = {}
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "nodes": {name: stats.summary() for name, stats in self.by_node.items()},
+                "models": {name: stats.summary() for name, stats in self.by_model.items()},
+            }
+
+    def print_summary(self):
+        snapshot = self.snapshot()
+        for group in ("models", "nodes"):
+            print(f"{group.title():<30} {'calls':>6} {'total s':>9} {'p95 s':>7} {'loads':>6} "
+                  f"{'prefill t/s':>12} {'decode t/s':>11}")
+            for name, s in sorted(snapshot[group].items(), key=lambda item: -item[1]["total_seconds"]):
+                print(f"{name:<30} {s['calls']:>6} {s['total_seconds']:>9.1f} {s['p95_seconds']:>7.1f} "
+                      f"{s['model_loads']:>6} {s['prefill_tokens_per_second']:>12.1f} {s['decode_tokens_per_second']:>11.1f}")
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            groups = [("node", self.by_node), ("model", self.by_model)]
+            metrics = [
+                ("calls_total", "counter", "Completed Ollama calls", lambda s: s.calls),
+                ("load_seconds_total", "counter", "Time spent loading models", lambda s: s.load_time),
+                ("model_loads_total", "counter", "Calls that waited for a model load", lambda s: s.model_loads),
+                ("prompt_tokens_total", "counter", "Prompt tokens evaluated", lambda s: s.prompt_tokens),
+                ("prompt_eval_seconds_total", "counter", "Time spent on prompt evaluation", lambda s: s.prompt_time),
+                ("completion_tokens_total", "counter", "Tokens generated", lambda s: s.completion_tokens),
+                ("completion_eval_seconds_total", "counter", "Time spent generating", lambda s: s.completion_time),
+            ]
+            for label, stats_by_name in groups:
+                prefix = f"virtworker_{label}"
+                for metric, kind, help_text, value in metrics:
+                    lines.append(f"# HELP {prefix}_{metric} {help_text}, per {label}")
+                    lines.append(f"# TYPE {prefix}_{metric} {kind}")
+                    for name, stats in sorted(stats_by_name.items()):
+                        lines.append(f'{prefix}_{metric}{{{label}="{_label(name)}"}} {value(stats)}')
+                lines.append(f"# HELP {prefix}_call_seconds Ollama total_duration per call, per {label}")
+                lines.append(f"# TYPE {prefix}_call_seconds histogram")
+                for name, stats in sorted(stats_by_name.items()):
+                    histogram = stats.latency
+                    labels = f'{label}="{_label(name)}"'
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{prefix}_call_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{prefix}_call_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f"{prefix}_call_seconds_sum{{{labels}}} {histogram.sum}")
+                    lines.append(f"{prefix}_call_seconds_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Write the metrics atomically so a textfile collector never reads a partial file."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".virtworker-metrics-")
+        with os.fdopen(fd, "w") as f:
+            f.write(self.to_prometheus())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+
+
+registry = MetricsRegistry()
+
+
+def snapshot():
+    return registry.snapshot()
+
+
+def print_summary():
+    registry.print_summary()
+
+
+def write_prometheus(path):
+    registry.write_prometheus(path)
+
+
+def reset():
+    registry.reset()
@@ -0,0 +1,484 @@
+import json
+import logging
+import time
+import asyncio
+import contextvars
+import itertools
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from . import metrics, trace
+from .cache import make_key
+from .context import SUMMARY_PREFIX, context_tokens, summary_message, summary_prompt, trim_context
+from .errors import OllamaError, OllamaUnavailableError, PromptTooLongError
+from .log import Payload, logger, node_logger
+from .prompt import TEMPLATES, PromptBuilder, template_for
+from .tokens import context_size_for, count_tokens, record_usage
+from .transport import get_transport
+
+
+class MapResult(namedtuple("MapResult", ["index", "input", "output", "error"])):
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class Node:
+    def __init__(self, model_name: str, name: str):
+        self.model_name = model_name
+        self.name = name
+        self.definition = ""
+        self.context = []
+        self.max_context_length = 10  # Maximum number of unpinned turns kept in the context
+        self.max_context_tokens = None  # Token budget for the context, None for no limit
+        self.context_mode = "sliding"  # "sliding" drops old turns, "summarize" compacts them
+        self.reuse_kv = False  # Keep the prompt prefix stable between trims so Ollama's prompt cache can reuse it
+        self.last_ttft = None
+        self.last_stats = {}
+        self.prompt_eval_total = 0
+        self.eval_total = 0
+        self.cache = None
+        self.template = None  # Chat template, detected from the model name when None
+        self.num_ctx = None  # Context window sent to Ollama, sized from the prompt when None
+        self.max_num_ctx = 32768  # Upper bound for the automatic context window
+        self.response_reserve = 2048  # Tokens kept free for the response when sizing num_ctx
+        self._auto_num_ctx = 2048
+        self._prompt_builder = PromptBuilder()
+        self._token_counts = {}  # Message text -> tokens under self._count_model
+        self._count_model = None
+        self._count_prompt = None
+        self.transport = None  # Shared transport for the default endpoint when None
+        self.keep_alive = None  # How long Ollama keeps the model loaded after a call, server default when None
+        self.raise_errors = False  # Raise failed calls instead of returning the error message as the output
+        self._context_lock = threading.Lock()
+        self._compacting = False  # A summary of evicted turns is being written
+        self.logger = node_logger(name)
+
+    def set_log_level(self, level):
+        """Set the log level of this node only, e.g. ``"DEBUG"`` or ``logging.WARNING``."""
+        self.logger.setLevel(level)
+
+    @property
+    def _transport(self):
+        return self.transport or get_transport()
+
+    @property
+    def prompt_template(self):
+        # Set self.template to a family name or a PromptTemplate to override detection
+        if self.template is None:
+            return template_for(self.model_name)
+        if isinstance(self.template, str):
+            return TEMPLATES[self.template]
+        return self.template
+
+    def _build_prompt(self, input_text, context=None):
+        if context is None:
+            context = self.context
+        if not context:
+            return self.prompt_template.render(self.definition, context, input_text)
+        return self._prompt_builder.render(self.prompt_template, self.definition, context, input_text)
+
+    @property
+    def _counter(self):
+        """``count_tokens`` for the current model; replaced, along with the memo, when the model changes."""
+        if self._count_model != self.model_name:
+            model = self.model_name
+            self._token_counts = {}
+            self._count_prompt = lambda text: count_tokens(text, model)
+            self._count_model = model
+        return self._count_prompt
+
+    def _count(self, text):
+        # Memoized per message text, since trimming would otherwise recount the whole history on every call
+        counter = self._counter
+        tokens = self._token_counts.get(text)
+        if tokens is None:
+            tokens = self._token_counts[text] = counter(text)
+        return tokens
+
+    def _context_size(self, prompt, max_tokens, prompt_tokens=None):
+        if prompt_tokens is None:
+            prompt_tokens = count_tokens(prompt, self.model_name)
+        limit = self.num_ctx or self.max_num_ctx
+        if prompt_tokens > limit:
+            raise PromptTooLongError(
+                f"[{self.name}] Prompt is about {prompt_tokens} tokens, more than the {limit} token context window")
+        if self.num_ctx:
+            return self.num_ctx
+        needed = prompt_tokens + min(max_tokens, self.response_reserve)
+        # Only ever grow: a different num_ctx makes Ollama reload the model
+        self._auto_num_ctx = max(self._auto_num_ctx, context_size_for(needed, self.max_num_ctx))
+        return self._auto_num_ctx
+
+    def _request_body(self, prompt, max_tokens, stream, prompt_tokens=None):
+        body = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "raw": True,
+            "stream": stream,
+            "options": {
+                "stop": self.prompt_template.stop,
+                "num_predict": max_tokens,
+                "num_ctx": self._context_size(prompt, max_tokens, prompt_tokens)
+            }
+        }
+        if self.keep_alive is not None:
+            body["keep_alive"] = self.keep_alive
+        return body
+
+    def _prepare(self, input_text, max_tokens, stream):
+        """Build the request body for a turn."""
+        self._fit_context()
+        with self._context_lock:
+            context = self.context
+        if not context:
+            return self._request_body(self._build_prompt(input_text, context), max_tokens, stream)
+        # Only the turns added since the previous call are counted
+        prompt, prompt_tokens = self._prompt_builder.render_counted(
+            self.prompt_template, self.definition, context, input_text, self._counter)
+        return self._request_body(prompt, max_tokens, stream, prompt_tokens)
+
+    def _finish(self, input_text, output):
+        # Both messages go in together so concurrent calls never interleave a turn
+        with self._context_lock:
+            self.context = self.context + [
+                {"role": "user", "content": input_text},
+                {"role": "assistant", "content": output},
+            ]
+
+    def _note_stats(self, data):
+        self.last_stats = {key: data[key] for key in (
+            "total_duration", "load_duration", "prompt_eval_count", "prompt_eval_duration",
+            "eval_count", "eval_duration") if key in data}
+        self.prompt_eval_total += data.get("prompt_eval_count", 0)
+        self.eval_total += data.get("eval_count", 0)
+        record_usage(data.get("prompt_eval_count", 0), data.get("eval_count", 0))
+        metrics.registry.record(self.name, self.model_name, data)
+
+    def pin(self, content, role="user"):
+        """Add a message that is never evicted from the context."""
+        with self._context_lock:
+            self.context = self.context + [{"role": role, "content": content, "pinned": True}]
+
+    def _fit_context(self):
+        count = self._count
+        summarize = self.context_mode == "summarize"
+        with self._context_lock:
+            if self._compacting:
+                # Another call is already summarizing these turns
+                return
+            context = self.context
+            # Trimming changes the start of the prompt and so defeats Ollama's prompt cache; with reuse_kv
+            # trim in batches so the prefix stays the same for several turns in between
+            kept, evicted = trim_context(context, self.max_context_length, self.max_context_tokens, count,
+                                         batch=summarize or self.reuse_kv)
+            if not evicted:
+                return
+            if not summarize:
+                self.context = kept
+            self._compacting = summarize
+        if summarize:
+            # The summary call can take minutes; other calls on this node must not wait for the lock meanwhile
+            try:
+                kept = self._summarize_evicted(kept, evicted)
+            finally:
+                with self._context_lock:
+                    self._compacting = False
+                    current = self.context
+                    # Keep turns finished or pinned while summarizing; a cleared context stays cleared
+                    if len(current) >= len(context) and all(a is b for a, b in zip(current, context)):
+                        self.context = kept + current[len(context):]
+        for msg in evicted:
+            # Only the texts in the context are worth remembering
+            self._token_counts.pop(msg["content"], None)
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("[%s] Evicted %d messages from the context (%d tokens kept)", self.name, len(evicted),
+                             context_tokens(self.context, count))
+
+    def _summarize_evicted(self, kept, evicted):
+        previous = next((msg for msg in kept if msg.get("summary")), None)
+        previous_summary = previous["content"][len(SUMMARY_PREFIX):] if previous else None
+        try:
+            summary = self._generate(self._build_prompt(summary_prompt(evicted, previous_summary), context=[]),
+                                     getattr(self, 'max_tokens', 8192))
+        except Exception as e:
+            self.logger.warning("[%s] Context summarization failed, dropping old turns instead: %s", self.name, e)
+            return kept
+        return [summary_message(summary)] + [msg for msg in kept if msg is not previous]
+
+    def _cache_key(self, body):
+        return make_key(body["model"], body["prompt"], body["options"])
+
+    def _post(self, body):
+        self._transport.ensure_healthy()
+        response = self._transport.post('/api/generate', json=body)
+        if response.status_code != 200:
+            raise OllamaError(f"Error in Ollama API call: {response.status_code} - {response.text}")
+        data = response.json()
+        self._note_stats(data)
+        return data
+
+    def _complete(self, body):
+        """Return Ollama's response object for ``body``, going through the cache if there is one.
+
+        Cache hits return only ``{"response": ..., "cached": True}``.
+        """
+        with trace.span(self.name, "call", model=self.model_name) as attributes:
+            start = time.perf_counter()
+            if self.cache is None:
+                data = self._post(body)
+            else:
+                data = {}
+
+                def compute():
+                    data.update(self._post(body))
+                    return data["response"].strip()
+
+                output = self.cache.get_or_compute(self._cache_key(body), compute)
+                data = data or {"response": output, "cached": True}
+            if trace.tracing_enabled():
+                attributes.update(trace.call_attributes(body, data, time.perf_counter() - start))
+            return data
+
+    def _generate(self, prompt, max_tokens):
+        return self._complete(self._request_body(prompt, max_tokens, stream=False))["response"].strip()
+
+    async def _apost(self, body):
+        with trace.span(self.name, "call", model=self.model_name) as attributes:
+            start = time.perf_counter()
+            status, data = await self._transport.apost('/api/generate', body)
+            if trace.tracing_enabled():
+                attributes.update(trace.call_attributes(body, data if status == 200 else None,
+                                                        time.perf_counter() - start))
+                if status != 200:
+                    attributes["error"] = f"status {status}"
+        if status != 200:
+            raise OllamaError(f"Error in Ollama API call: {status} - {data}")
+        self._note_stats(data)
+        return data
+
+    def __call__(self, input_text: str, max_tokens=8192, raise_errors=None):
+        """Send ``input_text`` as the next turn and return the response.
+
+        A failed call returns the error message as the output unless
+        ``raise_errors`` (default ``self.raise_errors``) is true. Ollama being
+        unreachable always raises ``OllamaUnavailableError``.
+        """
+        if raise_errors is None:
+            raise_errors = self.raise_errors
+        self.logger.info("[%s] Processing input:\n%s", self.name, Payload(input_text))
+        try:
+            body = self._prepare(input_text, max_tokens, stream=False)
+            data = self._complete(body)
+            output = data["response"].strip()
+            self._finish(input_text, output)
+            self.logger.info("[%s] Output:\n%s", self.name, Payload(output))
+            return output
+        except OllamaUnavailableError:
+            # No backend at all (including an open circuit) is not an answer; let the caller see it
+            raise
+        except OllamaError as e:
+            self.logger.error("[%s] %s", self.name, e)
+            if raise_errors:
+                raise
+            return str(e)
+        except Exception as e:
+            error_message = f"Error in processing: {str(e)}"
+            self.logger.exception("[%s] %s", self.name, error_message)
+            if raise_errors:
+                raise
+            return error_message
+
+    def imap(self, inputs, concurrency=4, ordered=True, max_tokens=None):
+        """Run the node over ``inputs`` with up to ``concurrency`` calls in flight.
+
+        Every input is processed with a fresh, empty context and the node's own
+        context is left untouched. Yields a ``MapResult`` per input, in input
+        order when ``ordered`` is true and in completion order otherwise.
+        Failures are reported through ``MapResult.error`` instead of raising.
+        """
+        if max_tokens is None:
+            max_tokens = getattr(self, 'max_tokens', 8192)
+
+        def run_one(index, input_text, submitted):
+            try:
+                with trace.span(f"{self.name}[{index}]", "item", queue_wait=time.perf_counter() - submitted):
+                    return MapResult(index, input_text, self._generate(self._build_prompt(input_text, context=[]), max_tokens), None)
+            except Exception as e:
+                return MapResult(index, input_text, None, e)
+
+        inputs = iter(enumerate(inputs))
+        pending = {}
+        finished = {}
+        next_index = 0
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            # Only keep `concurrency` inputs submitted so that large or lazy
+            # input iterables are never materialised up front
+            # Each item runs in a copy of the caller's context so token usage tracking follows it
+            for index, input_text in itertools.islice(inputs, concurrency):
+                pending[executor.submit(contextvars.copy_context().run, run_one, index, input_text, time.perf_counter())] = index
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del pending[future]
+                    result = future.result()
+                    if result.error is not None:
+                        self.logger.warning("[%s] Item %d failed: %s", self.name, result.index, result.error)
+                    if ordered:
+                        finished[result.index] = result
+                    else:
+                        yield result
+                    for index, input_text in itertools.islice(inputs, 1):
+                        pending[executor.submit(contextvars.copy_context().run, run_one, index, input_text, time.perf_counter())] = index
+                while next_index in finished:
+                    yield finished.pop(next_index)
+                    next_index += 1
+
+    def map(self, inputs, concurrency=4, max_tokens=None):
+        """Like ``imap`` but returns the list of ``MapResult`` in input order."""
+        return list(self.imap(inputs, concurrency=concurrency, ordered=True, max_tokens=max_tokens))
+
+    async def acall(self, input_text: str, max_tokens=8192, raise_errors=None):
+        """Async version of ``__call__`` on the shared aiohttp session.
+
+        Independent nodes awaited together with ``asyncio.gather`` run
+        concurrently, up to the number of parallel slots Ollama provides.
+        """
+        if raise_errors is None:
+            raise_errors = self.raise_errors
+        self.logger.info("[%s] Processing input (async):\n%s", self.name, Payload(input_text))
+        try:
+            await asyncio.to_thread(self._transport.ensure_healthy)
+            body = await asyncio.to_thread(self._prepare, input_text, max_tokens, False)
+            if self.cache is None:
+                output = (await self._apost(body))["response"].strip()
+            else:
+                loop = asyncio.get_running_loop()
+
+                def compute():
+                    # The request itself still goes out on this loop's aiohttp session
+                    return asyncio.run_coroutine_threadsafe(self._apost(body), loop).result()["response"].strip()
+
+                # In a thread, so that identical calls already in flight are waited for instead of repeated
+                output = await asyncio.to_thread(self.cache.get_or_compute, self._cache_key(body), compute)
+            self._finish(input_text, output)
+            self.logger.info("[%s] Output:\n%s", self.name, Payload(output))
+            return output
+        except OllamaUnavailableError:
+            raise
+        except OllamaError as e:
+            self.logger.error("[%s] %s", self.name, e)
+            if raise_errors:
+                raise
+            return str(e)
+        except Exception as e:
+            error_message = f"Error in processing: {str(e)}"
+            self.logger.exception("[%s] %s", self.name, error_message)
+            if raise_errors:
+                raise
+            return error_message
+
+    def stream(self, input_text: str, max_tokens=8192, raise_errors=None):
+        """Yield response tokens as Ollama produces them.
+
+        The full turn is appended to the context once the stream completes,
+        and the time to first token is kept in ``self.last_ttft`` (seconds).
+        A call identical to one already streaming waits for it and yields
+        its whole output at once. Errors are handled like in ``__call__``:
+        the error message is yielded as the last token unless
+        ``raise_errors`` (default ``self.raise_errors``) is true.
+        """
+        if raise_errors is None:
+            raise_errors = self.raise_errors
+        self.logger.info("[%s] Streaming input:\n%s", self.name, Payload(input_text))
+        started_at = time.time()
+        start_time = time.perf_counter()
+        self.last_ttft = None
+        pending = None  # Cache entry this call is computing for any identical calls
+        try:
+            body = self._prepare(input_text, max_tokens, stream=True)
+            cached = None
+            if self.cache is not None:
+                key = self._cache_key(body)
+                cached, pending, leader = self.cache.claim(key)
+                if not leader:
+                    cached = cached if cached is not None else pending.result()
+                    pending = None
+            if cached is not None:
+                self.last_ttft = time.perf_counter() - start_time
+                self._finish(input_text, cached)
+                yield cached
+                return
+            self._transport.ensure_healthy()
+            with self._transport.post('/api/generate', json=body, stream=True) as response:
+                if response.status_code != 200:
+                    raise OllamaError(f"Error in Ollama API call: {response.status_code} - {response.text}")
+
+                chunks = []
+                data = None
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if "error" in data:
+                        raise RuntimeError(data["error"])
+                    token = data.get("response", "")
+                    if token:
+                        if self.last_ttft is None:
+                            self.last_ttft = time.perf_counter() - start_time
+                            self.logger.debug("[%s] First token after %.3fs", self.name, self.last_ttft)
+                        chunks.append(token)
+                        yield token
+                    if data.get("done"):
+                        self._note_stats(data)
+                        break
+            if trace.tracing_enabled():
+                duration = time.perf_counter() - start_time
+                trace.record_span(self.name, "call", started_at, duration, model=self.model_name, stream=True,
+                                  ttft=self.last_ttft, **trace.call_attributes(body, data, duration))
+            output = "".join(chunks).strip()
+            if pending is not None:
+                self.cache.resolve(key, pending, output)
+        except OllamaUnavailableError as e:
+            if pending is not None:
+                self.cache.resolve(key, pending, error=e)
+            raise
+        except OllamaError as e:
+            if pending is not None:
+                self.cache.resolve(key, pending, error=e)
+            self.logger.error("[%s] %s", self.name, e)
+            if raise_errors:
+                raise
+            yield str(e)
+            return
+        except Exception as e:
+            if pending is not None:
+                self.cache.resolve(key, pending, error=e)
+            error_message = f"Error in processing: {str(e)}"
+            self.logger.exception("[%s] %s", self.name, error_message)
+            if raise_errors:
+                raise
+            yield error_message
+            return
+        finally:
+            if pending is not None and not pending.done():
+                # The consumer stopped reading before the response was complete
+                self.cache.resolve(key, pending, error=OllamaError("Stream closed before the response was complete"))
+
+        self._finish(input_text, output)
+        self.logger.info("[%s] Streamed %d characters in %.3fs", self.name, len(output), time.perf_counter() - start_time)
+
+    def clear_context(self, keep_pinned=False):
+        with self._context_lock:
+            self.context = [msg for msg in self.context if msg.get("pinned")] if keep_pinned else []
+        self._token_counts = {}
+        self.logger.info("[%s] Context cleared.", self.name)
+
+
+def create_node(model_name: str, name: str, max_tokens=8192, cache=None):
+    logger.info("Creating node '%s' with model '%s' and max_tokens %d", name, model_name, max_tokens)
+    node = Node(model_name, name)
+    node.max_tokens = max_tokens
+    node.cache = cache
+    return node
@@ -0,0 +1,196 @@
+"""Load balancing across several Ollama servers.
+
+A ``BackendPool`` can be used anywhere a ``Transport`` is: assign it to
+``node.transport`` or make it the default with ``set_default_transport``.
+Each request goes to the healthy endpoint that serves the requested model and
+has the fewest requests in flight. When an endpoint stops answering it is
+taken out of rotation, the request is retried on another endpoint, and the
+endpoint is probed again after ``recheck_interval`` seconds.
+"""
+import logging
+import threading
+import time
+
+from .errors import OllamaError, OllamaUnavailableError
+from .transport import Transport
+
+logger = logging.getLogger(__name__)
+
+
+class Endpoint:
+    def __init__(self, transport, models=None):
+        self.transport = transport
+        self.models = set(models) if models is not None else None
+        self.outstanding = 0
+        self.completed = 0
+        self.healthy = True
+        self.down_since = None
+
+    @property
+    def base_url(self):
+        return self.transport.base_url
+
+    def serves(self, model):
+        if self.models is None:
+            return True
+        # Ollama reports "llama3.1:8b"; a bare "llama3.1" means ":latest"
+        return model in self.models or (":" not in model and f"{model}:latest" in self.models)
+
+    def __repr__(self):
+        return f"Endpoint({self.base_url!r}, outstanding={self.outstanding}, healthy={self.healthy})"
+
+
+class BackendPool:
+    def __init__(self, urls, models=None, recheck_interval=30.0, **transport_options):
+        """``models`` optionally maps a URL to the models it serves; other
+        endpoints are asked with ``/api/tags`` the first time they are needed."""
+        # Fail over quickly instead of retrying a dead endpoint for long
+        transport_options.setdefault("max_retries", 1)
+        models = models or {}
+        self.endpoints = [Endpoint(Transport(url, **transport_options), models.get(url)) for url in urls]
+        self.recheck_interval = recheck_interval
+        self._lock = threading.Lock()
+        self._inventory_loaded = bool(models) and all(e.models is not None for e in self.endpoints)
+        self._next = 0
+        self._checked = False
+        self._check_lock = threading.Lock()
+
+    def __repr__(self):
+        return f"BackendPool({[e.base_url for e in self.endpoints]!r})"
+
+    def refresh_models(self):
+        for endpoint in self.endpoints:
+            if not endpoint.healthy:
+                continue
+            try:
+                response = endpoint.transport.get("/api/tags")
+            except OllamaUnavailableError as e:
+                self._mark_down(endpoint, e)
+                continue
+            if response.status_code == 200:
+                endpoint.models = {model["name"] for model in response.json().get("models", [])}
+        self._inventory_loaded = True
+
+    def check_health(self):
+        for endpoint in self.endpoints:
+            self._probe(endpoint)
+        return [endpoint for endpoint in self.endpoints if endpoint.healthy]
+
+    def _probe(self, endpoint):
+        try:
+            response = endpoint.transport.get("/api/version", timeout=(endpoint.transport.connect_timeout,) * 2)
+        except OllamaUnavailableError as e:
+            self._mark_down(endpoint, e)
+            return False
+        if response.status_code != 200:
+            self._mark_down(endpoint, f"status {response.status_code}")
+            return False
+        if not endpoint.healthy:
+            logger.warning("Endpoint %s is back up", endpoint.base_url)
+        endpoint.healthy = True
+        endpoint.down_since = None
+        return True
+
+    def _mark_down(self, endpoint, reason):
+        if endpoint.healthy:
+            logger.warning("Endpoint %s is down: %s", endpoint.base_url, reason)
+        endpoint.healthy = False
+        endpoint.down_since = time.monotonic()
+
+    def _recheck_down_endpoints(self):
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for endpoint in self.endpoints:
+                if not endpoint.healthy and now - endpoint.down_since >= self.recheck_interval:
+                    # Claim the recheck so concurrent callers don't all probe the same endpoint
+                    endpoint.down_since = now
+                    due.append(endpoint)
+        for endpoint in due:
+            self._probe(endpoint)
+
+    def choose(self, model=None, exclude=()):
+        """Pick the endpoint for ``model`` with the fewest requests in flight."""
+        if model is not None and not self._inventory_loaded:
+            with self._check_lock:
+                if not self._inventory_loaded:
+                    self.refresh_models()
+        self._recheck_down_endpoints()
+        with self._lock:
+            candidates = [e for e in self.endpoints
+                          if e.healthy and e not in exclude and e.transport.breaker.state != "open"
+                          and (model is None or e.serves(model))]
+            if not candidates:
+                return None
+            # Rotate the starting point so ties are spread evenly
+            start = self._next % len(candidates)
+            self._next += 1
+            rotated = candidates[start:] + candidates[:start]
+            endpoint = min(rotated, key=lambda e: e.outstanding)
+            endpoint.outstanding += 1
+            return endpoint
+
+    def _release(self, endpoint):
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.completed += 1
+
+    def _no_endpoint(self, model, tried):
+        if model is not None and not any(e.serves(model) for e in self.endpoints):
+            return OllamaError(f"No endpoint in the pool serves model '{model}'")
+        return OllamaUnavailableError(
+            f"No healthy endpoint left for model '{model}' (tried {', '.join(e.base_url for e in tried) or 'none'})")
+
+    def request(self, method, path, json=None, **kwargs):
+        model = (json or {}).get("model")
+        tried = []
+        while True:
+            endpoint = self.choose(model, exclude=tried)
+            if endpoint is None:
+                raise self._no_endpoint(model, tried)
+            tried.append(endpoint)
+            try:
+                return endpoint.transport.request(method, path, json=json, **kwargs)
+            except OllamaUnavailableError as e:
+                self._mark_down(endpoint, e)
+            finally:
+                self._release(endpoint)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, json=None, **kwargs):
+        return self.request("POST", path, json=json, **kwargs)
+
+    async def apost(self, path, body):
+        model = body.get("model")
+        tried = []
+        while True:
+            endpoint = self.choose(model, exclude=tried)
+            if endpoint is None:
+                raise self._no_endpoint(model, tried)
+            tried.append(endpoint)
+            try:
+                return await endpoint.transport.apost(path, body)
+            except OllamaUnavailableError as e:
+                self._mark_down(endpoint, e)
+            finally:
+                self._release(endpoint)
+
+    def ensure_healthy(self):
+        with self._check_lock:
+            if not self._checked:
+                self.check_health()
+                self._checked = True
+        self._recheck_down_endpoints()
+        if not any(endpoint.healthy for endpoint in self.endpoints):
+            raise OllamaUnavailableError(f"None of the endpoints in {self!r} is reachable")
+
+    def status(self):
+        return [{"url": e.base_url, "healthy": e.healthy, "outstanding": e.outstanding,
+                 "completed": e.completed, "models": sorted(e.models) if e.models is not None else None}
+                for e in self.endpoints]
+
+    def close(self):
+        for endpoint in self.endpoints:
+            endpoint.transport.close()
@@ -0,0 +1,139 @@
+"""Prompt templates and incremental prompt rendering.
+
+Nodes send raw prompts to Ollama, so the chat template has to match the model
+family. ``template_for`` picks one from the model name, and ``PromptBuilder``
+keeps the rendered history of a node so that each call only formats the
+messages added since the previous one.
+"""
+import threading
+
+
+class PromptTemplate:
+    def __init__(self, name, message, generation, end_of_turn, stop, roles=None):
+        self.name = name
+        self.message = message
+        self.generation = generation
+        self.end_of_turn = end_of_turn
+        self.stop = stop
+        self.roles = roles or {}
+
+    def format_message(self, role, content):
+        return self.message.format(role=self.roles.get(role, role), content=content)
+
+    def render(self, definition, context, input_text):
+        parts = [self.format_message("system", definition)]
+        parts.extend(self.format_message(msg["role"], msg["content"]) for msg in context)
+        parts.append(self.format_message("user", input_text))
+        parts.append(self.generation)
+        return "".join(parts)
+
+
+TEMPLATES = {
+    "llama3": PromptTemplate(
+        "llama3",
+        message="<|start_header_id|>{role}<|end_header_id|>\n\n{content}<|eot_id|>",
+        generation="<|start_header_id|>assistant<|end_header_id|>\n\n",
+        end_of_turn="<|eot_id|>",
+        stop=["<|start_header_id|>", "<|end_header_id|>", "<|eot_id|>"],
+    ),
+    "gemma": PromptTemplate(
+        "gemma",
+        message="<start_of_turn>{role}\n{content}<end_of_turn>\n",
+        generation="<start_of_turn>model\n",
+        end_of_turn="<end_of_turn>\n",
+        stop=["<start_of_turn>", "<end_of_turn>"],
+        # Gemma has no system role, instructions go in a user turn
+        roles={"assistant": "model", "system": "user"},
+    ),
+    "chatml": PromptTemplate(
+        "chatml",
+        message="<|im_start|>{role}\n{content}<|im_end|>\n",
+        generation="<|im_start|>assistant\n",
+        end_of_turn="<|im_end|>\n",
+        stop=["<|im_start|>", "<|im_end|>"],
+    ),
+    "phi3": PromptTemplate(
+        "phi3",
+        message="<|{role}|>\n{content}<|end|>\n",
+        generation="<|assistant|>\n",
+        end_of_turn="<|end|>\n",
+        stop=["<|end|>", "<|user|>", "<|assistant|>"],
+    ),
+}
+
+MODEL_FAMILIES = [
+    ("gemma", "gemma"),
+    ("qwen", "chatml"),
+    ("hermes", "chatml"),
+    ("dolphin", "chatml"),
+    ("yi", "chatml"),
+    ("phi3", "phi3"),
+    ("phi-3", "phi3"),
+    ("llama3", "llama3"),
+]
+
+
+def template_for(model_name):
+    """Return the template for ``model_name``, falling back to llama3."""
+    name = model_name.lower()
+    for prefix, family in MODEL_FAMILIES:
+        if name.startswith(prefix):
+            return TEMPLATES[family]
+    return TEMPLATES["llama3"]
+
+
+class PromptBuilder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._first = None
+        self._last = None
+        self._count = 0
+        self._history = ""
+        self._counter = None
+        self._history_tokens = None  # Tokens in self._history according to self._counter, None if not counted
+
+    def _update(self, template, definition, context):
+        # Caller holds self._lock
+        reusable = (
+            self._key == (template.name, definition)
+            and len(context) >= self._count
+            and (self._count == 0 or (context[0] is self._first and context[self._count - 1] is self._last))
+        )
+        if not reusable:
+            self._key = (template.name, definition)
+            self._count = 0
+            self._history = template.format_message("system", definition)
+            self._history_tokens = None
+        if len(context) > self._count:
+            added = "".join(template.format_message(msg["role"], msg["content"]) for msg in context[self._count:])
+            self._history += added
+            if self._history_tokens is not None:
+                self._history_tokens += self._counter(added)
+            self._count = len(context)
+        self._first = context[0] if context else None
+        self._last = context[-1] if context else None
+
+    def render(self, template, definition, context, input_text):
+        with self._lock:
+            self._update(template, definition, context)
+            history = self._history
+        return history + template.format_message("user", input_text) + template.generation
+
+    def render_counted(self, template, definition, context, input_text, count):
+        """Like ``render``, also returning the number of tokens in the prompt according to ``count``.
+
+        The count of the history is kept along with it, so only the messages
+        added since the previous call and the new turn are counted.
+        """
+        with self._lock:
+            if count != self._counter:
+                self._counter = count
+                self._history_tokens = None
+            self._update(template, definition, context)
+            if self._history_tokens is None:
+                self._history_tokens = count(self._history)
+            history = self._history
+            history_tokens = self._history_tokens
+        turn = template.format_message("user", input_text) + template.generation
+        return history + turn, history_tokens + count(turn)
@@ -0,0 +1,137 @@
+"""Model-aware ordering of ready workflow steps.
+
+Ollama keeps only a few models in memory (``OLLAMA_MAX_LOADED_MODELS``) and
+unloads a model ``keep_alive`` after its last use. When a workflow alternates
+between models every switch costs a model load. ``ModelScheduler`` picks which
+ready step to start next so that steps for models that are already loaded go
+first, and only loads another model once no running step needs the one it
+would replace.
+"""
+import logging
+import math
+import time
+from collections import Counter, OrderedDict
+
+from .transport import get_transport
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KEEP_ALIVE = "5m"
+
+
+def parse_keep_alive(value):
+    """Convert an Ollama ``keep_alive`` value to seconds (inf for negative values)."""
+    if value is None:
+        value = DEFAULT_KEEP_ALIVE
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        text = value.strip()
+        for suffix in ("ms", "s", "m", "h"):
+            if text.endswith(suffix):
+                seconds = float(text[:-len(suffix)]) * units[suffix]
+                break
+        else:
+            seconds = float(text)
+    return math.inf if seconds < 0 else seconds
+
+
+def preload_model(model, keep_alive=None, transport=None):
+    """Ask Ollama to load ``model`` without generating anything."""
+    transport = transport or get_transport()
+    body = {"model": model}
+    if keep_alive is not None:
+        body["keep_alive"] = keep_alive
+    logger.info("Preloading model '%s'", model)
+    response = transport.post("/api/generate", json=body)
+    return response.status_code == 200
+
+
+def count_loads(models, capacity, keep_alive_seconds=math.inf, times=None):
+    """Number of model loads an LRU with ``capacity`` slots needs for ``models`` in order."""
+    resident = OrderedDict()
+    loads = 0
+    for i, model in enumerate(models):
+        if model is None:
+            continue
+        now = times[i] if times else 0.0
+        for name, last_used in list(resident.items()):
+            if now - last_used > keep_alive_seconds:
+                del resident[name]
+        if model not in resident:
+            loads += 1
+            if len(resident) >= capacity:
+                resident.popitem(last=False)
+        resident[model] = now
+        resident.move_to_end(model)
+    return loads
+
+
+class ModelScheduler:
+    def __init__(self, max_loaded_models=1, keep_alive=None):
+        self.max_loaded_models = max_loaded_models
+        self.keep_alive_seconds = parse_keep_alive(keep_alive)
+        self.resident = OrderedDict()  # model -> time of last use, least recent first
+        self.loads = 0
+        self.ready_order = []
+        self.start_order = []
+
+    def _expire(self, now):
+        for model, last_used in list(self.resident.items()):
+            if now - last_used > self.keep_alive_seconds:
+                del self.resident[model]
+
+    def note_ready(self, model):
+        self.ready_order.append((model, time.monotonic()))
+
+    def pick(self, ready, model_of, running_models):
+        """Return the index in ``ready`` of the step to start next, or None to wait.
+
+        ``model_of`` maps a step to its model (None for steps that don't call
+        one) and ``running_models`` counts the models of running steps.
+        """
+        now = time.monotonic()
+        self._expire(now)
+        by_model = {}
+        for index, step in enumerate(ready):
+            model = model_of(step)
+            if model is None:
+                return index
+            by_model.setdefault(model, index)
+
+        # Most recently used resident model first
+        for model in reversed(self.resident):
+            if model in by_model:
+                return by_model[model]
+
+        if len(self.resident) >= self.max_loaded_models:
+            idle = [model for model in self.resident if not running_models.get(model)]
+            if not idle:
+                # Every loaded model is still in use, loading another would swap one out
+                return None
+            del self.resident[idle[0]]
+
+        counts = Counter(model_of(step) for step in ready)
+        model = max(by_model, key=lambda m: (counts[m], -by_model[m]))
+        return by_model[model]
+
+    def note_start(self, model):
+        now = time.monotonic()
+        self.start_order.append((model, now))
+        if model is None:
+            return
+        if model not in self.resident:
+            self.loads += 1
+        self.resident[model] = now
+        self.resident.move_to_end(model)
+
+    def loads_without_scheduling(self):
+        """Model loads the run would have needed starting steps in the order they became ready."""
+        models = [model for model, _ in self.ready_order]
+        times = [t for _, t in self.ready_order]
+        return count_loads(models, self.max_loaded_models, self.keep_alive_seconds, times)
+
+    @property
+    def switches_avoided(self):
+        return max(0, self.loads_without_scheduling() - self.loads)
@@ -0,0 +1,112 @@
+"""Token counting and usage accounting.
+
+``count_tokens`` uses a Hugging Face tokenizer for the model family when one
+is available in the local cache and a fast character-based estimate
+otherwise. ``track_usage`` collects the prompt and completion tokens reported
+by Ollama for every call made inside it, including calls made by
+``Node.map`` worker threads and asyncio tasks started from it.
+"""
+import contextvars
+import math
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+# Hugging Face repositories whose tokenizers match the Ollama model families
+TOKENIZER_REPOS = {
+    "llama3": "meta-llama/Meta-Llama-3-8B-Instruct",
+    "gemma": "google/gemma-2-9b-it",
+    "qwen": "Qwen/Qwen2-7B-Instruct",
+    "phi3": "microsoft/Phi-3-mini-4k-instruct",
+}
+
+CONTEXT_SIZES = [2048, 4096, 8192, 16384, 32768, 65536, 131072]
+
+_registered = {}
+_registered_lock = threading.Lock()
+
+
+def register_tokenizer(model_prefix, tokenizer):
+    """Use ``tokenizer`` (anything with ``encode``) for models starting with ``model_prefix``."""
+    with _registered_lock:
+        _registered[model_prefix.lower()] = tokenizer
+    get_tokenizer.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model_name):
+    name = model_name.lower()
+    with _registered_lock:
+        for prefix, tokenizer in _registered.items():
+            if name.startswith(prefix):
+                return tokenizer
+    repo = next((repo for prefix, repo in TOKENIZER_REPOS.items() if name.startswith(prefix)), None)
+    if repo is None:
+        return None
+    try:
+        from transformers import AutoTokenizer
+        # Never download here, a missing tokenizer just means estimating
+        return AutoTokenizer.from_pretrained(repo, local_files_only=True)
+    except Exception:
+        return None
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text with llama-style vocabularies
+    return math.ceil(len(text) / 4)
+
+
+def count_tokens(text, model_name=None):
+    tokenizer = get_tokenizer(model_name) if model_name else None
+    if tokenizer is None:
+        return estimate_tokens(text)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def context_size_for(tokens, maximum):
+    """Smallest standard ``num_ctx`` that holds ``tokens``, capped at ``maximum``."""
+    for size in CONTEXT_SIZES:
+        if size >= tokens:
+            return min(size, maximum)
+    return maximum
+
+
+class TokenUsage:
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, prompt_tokens, completion_tokens):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    def __repr__(self):
+        return (f"TokenUsage(calls={self.calls}, prompt_tokens={self.prompt_tokens}, "
+                f"completion_tokens={self.completion_tokens})")
+
+
+_collectors = contextvars.ContextVar("virtworker_token_collectors", default=())
+
+
+@contextmanager
+def track_usage(usage=None):
+    """Collect token usage of every node call made inside the ``with`` block."""
+    usage = usage or TokenUsage()
+    token = _collectors.set(_collectors.get() + (usage,))
+    try:
+        yield usage
+    finally:
+        _collectors.reset(token)
+
+
+def record_usage(prompt_tokens, completion_tokens):
+    for usage in _collectors.get():
+        usage.add(prompt_tokens, completion_tokens)
@@ -0,0 +1,259 @@
+"""Structured JSONL tracing of node calls and workflow steps.
+
+Tracing is off until ``start_tracing(path)`` is called. Every node call then
+produces one span with the run id, parent span, node and model, a hash and
+the byte sizes of the prompt, token counts, queue wait and both network and
+server-side timings. Workflows add a span per run and per step, so node
+spans nest under the step that made them.
+
+Spans are handed to a background thread that serialises and writes them, so
+the calling thread only pays for building a dict and a queue put.
+
+Summarise a trace with:
+
+    python -m virtworker.trace trace.jsonl
+"""
+import argparse
+import contextvars
+import hashlib
+import json
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+NANOSECONDS = 1e9
+
+_tracer = None
+_current = contextvars.ContextVar("virtworker_current_span", default=None)
+
+
+class Tracer:
+    def __init__(self, path, run_id=None, flush_interval=1.0):
+        self.path = path
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._file = open(path, "a", buffering=1 << 16)
+        self._thread = threading.Thread(target=self._write_loop, name="virtworker-trace", daemon=True)
+        self._thread.start()
+
+    def emit(self, span):
+        self._queue.put(span)
+
+    def _write_loop(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                span = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                span = False
+            if span is None:
+                break
+            if span:
+                self._file.write(json.dumps(span, default=str) + "\n")
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self._file.flush()
+                last_flush = time.monotonic()
+        self._file.flush()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+
+def start_tracing(path, run_id=None):
+    """Append spans to ``path`` until ``stop_tracing()``. Returns the tracer."""
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+    _tracer = Tracer(path, run_id)
+    return _tracer
+
+
+def stop_tracing():
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+        _tracer = None
+
+
+def tracing_enabled():
+    return _tracer is not None
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def _new_record(name, kind):
+    parent = _current.get()
+    record = {
+        "run_id": _tracer.run_id,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent["span_id"] if parent else None,
+        "workflow": parent.get("workflow") if parent else None,
+        "name": name,
+        "kind": kind,
+    }
+    if kind == "workflow":
+        record["workflow"] = name
+    return record
+
+
+def record_span(name, kind, start, duration, **attributes):
+    """Emit a finished span, for code such as generators that can't hold a ``with`` block open.
+
+    ``start`` is a ``time.time()`` timestamp.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return
+    record = _new_record(name, kind)
+    record.update(start=start, duration=duration, end=start + duration)
+    record.update(attributes)
+    tracer.emit(record)
+
+
+@contextmanager
+def span(name, kind, **attributes):
+    """Record a span around the ``with`` block.
+
+    Yields a dict the block can add attributes to. Spans opened inside the
+    block, including in workflow steps and ``Node.map`` workers started from
+    it, get this span as their parent.
+    """
+    if _tracer is None:
+        yield attributes
+        return
+    record = _new_record(name, kind)
+    token = _current.set(record)
+    record["start"] = time.time()
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes["error"] = f"{e.__class__.__name__}: {e}"
+        raise
+    finally:
+        record["duration"] = time.perf_counter() - start
+        record["end"] = record["start"] + record["duration"]
+        _current.reset(token)
+        record.update(attributes)
+        tracer = _tracer
+        if tracer is not None:
+            tracer.emit(record)
+
+
+def call_attributes(body, data, wall_time):
+    """Span attributes for one Ollama call from its request body and final response."""
+    attributes = {
+        "prompt_hash": prompt_hash(body["prompt"]),
+        "prompt_bytes": len(body["prompt"].encode("utf-8")),
+        "context_tokens": len(body.get("context") or ()),
+    }
+    if data is None:
+        return attributes
+    attributes["response_bytes"] = len(data.get("response", "").encode("utf-8"))
+    if data.get("cached"):
+        attributes["cached"] = True
+        return attributes
+    server_time = data.get("total_duration", 0) / NANOSECONDS
+    attributes.update({
+        "prompt_tokens": data.get("prompt_eval_count", 0),
+        "completion_tokens": data.get("eval_count", 0),
+        "server_seconds": server_time,
+        "load_seconds": data.get("load_duration", 0) / NANOSECONDS,
+        "prompt_eval_seconds": data.get("prompt_eval_duration", 0) / NANOSECONDS,
+        "eval_seconds": data.get("eval_duration", 0) / NANOSECONDS,
+        "network_seconds": max(0.0, wall_time - server_time),
+    })
+    return attributes
+
+
+def load_spans(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def critical_path(spans, root):
+    """Spans on the critical path under ``root``, outermost first.
+
+    Workflow steps follow their recorded dependencies. Other children fall
+    back to the latest-ending sibling that finished before the current span
+    started.
+    """
+    children = [s for s in spans if s["parent_id"] == root["span_id"]]
+    if not children:
+        return [root]
+    by_step = {s["name"]: s for s in children if s["kind"] == "step"}
+    current = max(children, key=lambda s: s["end"])
+    chain = [current]
+    while True:
+        if current.get("depends_on") is not None:
+            deps = [by_step[name] for name in current["depends_on"] if name in by_step]
+        else:
+            deps = [s for s in children if s["end"] <= current["start"]]
+        if not deps:
+            break
+        current = max(deps, key=lambda s: s["end"])
+        chain.append(current)
+    path = [root]
+    for s in reversed(chain):
+        path.extend(critical_path(spans, s))
+    return path
+
+
+def summarize(spans):
+    lines = []
+    # Calls and map items made outside a workflow are only counted in the totals below
+    roots = [s for s in spans if s["parent_id"] is None and s["kind"] == "workflow"]
+    for root in sorted(roots, key=lambda s: s["start"]):
+        lines.append(f"{root['kind']} '{root['name']}' (run {root['run_id']}): {root['duration']:.2f}s")
+        path = critical_path(spans, root)
+        if len(path) > 1:
+            lines.append("  critical path:")
+            for s in path[1:]:
+                share = s["duration"] / root["duration"] * 100 if root["duration"] else 0.0
+                detail = ""
+                if s["kind"] == "call":
+                    detail = (f"  server {s.get('server_seconds', 0):.2f}s network {s.get('network_seconds', 0):.2f}s "
+                              f"tokens {s.get('prompt_tokens', 0)}/{s.get('completion_tokens', 0)}")
+                lines.append(f"    {s['kind']:<5} {s['name']:<40} {s['duration']:8.2f}s {share:5.1f}%"
+                             f"  wait {s.get('queue_wait', 0):.2f}s{detail}")
+
+    calls = [s for s in spans if s["kind"] == "call"]
+    if calls:
+        lines.append("")
+        lines.append(f"{len(calls)} calls, {sum(s['duration'] for s in calls):.2f}s in calls, "
+                     f"{sum(s.get('queue_wait', 0) for s in spans if s['kind'] in ('step', 'item')):.2f}s "
+                     f"waiting for a worker")
+        lines.append(f"  server {sum(s.get('server_seconds', 0) for s in calls):.2f}s "
+                     f"(load {sum(s.get('load_seconds', 0) for s in calls):.2f}s, "
+                     f"prefill {sum(s.get('prompt_eval_seconds', 0) for s in calls):.2f}s, "
+                     f"decode {sum(s.get('eval_seconds', 0) for s in calls):.2f}s), "
+                     f"network and client {sum(s.get('network_seconds', 0) for s in calls):.2f}s")
+        by_node = {}
+        for s in calls:
+            by_node[s["name"]] = by_node.get(s["name"], 0.0) + s["duration"]
+        lines.append("  time per node:")
+        for name, seconds in sorted(by_node.items(), key=lambda item: -item[1]):
+            lines.append(f"    {name:<40} {seconds:8.2f}s")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a virtworker JSONL trace into a critical-path report.")
+    parser.add_argument("trace", help="JSONL file written by start_tracing()")
+    parser.add_argument("--run", help="Only include spans from this run id")
+    args = parser.parse_args()
+    spans = load_spans(args.trace)
+    if args.run:
+        spans = [s for s in spans if s["run_id"] == args.run]
+    print(summarize(spans))
+
+
+if __name__ == "__main__":
+    main()
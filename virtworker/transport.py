@@ -0,0 +1,178 @@
+"""HTTP transport shared by every node talking to the same Ollama endpoint.
+
+A ``Transport`` owns a pooled keep-alive ``requests.Session`` and applies
+connect/read timeouts, retries transient failures with exponential backoff
+and full jitter, and trips a circuit breaker after repeated failures so that
+calls fail fast while the backend is down.
+"""
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .errors import CircuitOpenError, OllamaUnavailableError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = os.environ.get("VIRTWORKER_OLLAMA_URL", "http://localhost:11434")
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def before_call(self, name):
+        # In half-open state calls are let through; the first result decides
+        if self.state == "open":
+            raise CircuitOpenError(
+                f"Ollama at {name} failed {self.failures} times in a row, not retrying for {self.reset_timeout:.0f}s")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class Transport:
+    def __init__(self, base_url=DEFAULT_URL, connect_timeout=5.0, read_timeout=600.0, max_retries=3,
+                 backoff=0.5, max_backoff=30.0, pool_size=32, breaker=None):
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._healthy = False
+        self._health_lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Transport({self.base_url!r})"
+
+    def retry_delay(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def request(self, method, path, **kwargs):
+        """Send a request, retrying connection errors, timeouts and 429/502/503/504 responses.
+
+        Raises ``OllamaUnavailableError`` when the endpoint cannot be reached
+        after all retries and ``CircuitOpenError`` while the breaker is open.
+        Other error statuses are returned to the caller.
+        """
+        self.breaker.before_call(self.base_url)
+        kwargs.setdefault("timeout", (self.connect_timeout, self.read_timeout))
+        url = self.base_url + path
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last_attempt:
+                    self.breaker.record_failure()
+                    raise OllamaUnavailableError(f"Ollama is not reachable at {self.base_url} ({e})") from e
+                logger.warning("Request to %s failed (%s), retrying", url, e.__class__.__name__)
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                if last_attempt:
+                    self.breaker.record_failure()
+                    return response
+                logger.warning("Request to %s returned %d, retrying", url, response.status_code)
+                response.close()
+            time.sleep(self.retry_delay(attempt))
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, json=None, **kwargs):
+        return self.request("POST", path, json=json, **kwargs)
+
+    async def apost(self, path, body):
+        """Async POST with the same timeouts, retries and breaker; see aio.post_json."""
+        from . import aio
+        return await aio.post_json(self, path, body)
+
+    def ensure_healthy(self):
+        """Check once that the endpoint answers ``/api/version``.
+
+        A successful check is remembered for the life of the transport; a
+        failed one raises ``OllamaUnavailableError`` and is retried next time.
+        """
+        if self._healthy:
+            return
+        with self._health_lock:
+            if self._healthy:
+                return
+            try:
+                response = self.get("/api/version", timeout=(self.connect_timeout, self.connect_timeout))
+            except OllamaUnavailableError as e:
+                raise e.__class__(f"{e}. Please start Ollama with 'ollama serve'.") from e
+            if response.status_code != 200:
+                raise OllamaUnavailableError(
+                    f"Ollama at {self.base_url} is not responding correctly: {response.status_code} - {response.text}")
+            self._healthy = True
+
+    def close(self):
+        self.session.close()
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+_default_url = DEFAULT_URL
+_default_transport = None
+
+
+def set_default_url(url):
+    """Point every node without an explicit transport at ``url``."""
+    global _default_url
+    _default_url = url.rstrip("/")
+
+
+def set_default_transport(transport):
+    """Use ``transport`` (for example a BackendPool) for every node without its own.
+
+    Pass None to go back to the shared transport for the default URL.
+    """
+    global _default_transport
+    _default_transport = transport
+
+
+def get_transport(base_url=None):
+    """Return the shared transport for ``base_url`` (the default transport when None)."""
+    if base_url is None and _default_transport is not None:
+        return _default_transport
+    base_url = (base_url or _default_url).rstrip("/")
+    with _transports_lock:
+        transport = _transports.get(base_url)
+        if transport is None:
+            transport = _transports[base_url] = Transport(base_url)
+        return transport
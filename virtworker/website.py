@@ -0,0 +1,85 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Website:
+    def __init__(self, url, use_rss=False, rss_feed_url=None, extractor=None):
+        self.url = url
+        self.use_rss = use_rss
+        self.rss_feed_url = rss_feed_url
+        self.extractor = extractor  # Name or callable, see virtworker.extract; the default extractor when None
+        self.extraction = None
+        self._text = None
+
+    @classmethod
+    def from_feed(cls, rss_feed_url, max_entries=None):
+        """One Website per entry of the feed, reading its text from the entry summary."""
+        from .feeds import feed_entries
+
+        entries = feed_entries(rss_feed_url)[:max_entries]
+        return [cls(entry.link, use_rss=True, rss_feed_url=rss_feed_url) for entry in entries if entry.get("link")]
+
+    @property
+    def text(self):
+        if self._text is None:
+            if self.use_rss:
+                self._text = self._fetch_from_rss()
+            else:
+                self._text = self._fetch_from_url()
+            logger.info("Fetched %d characters from the website", len(self._text))
+        return self._text
+
+    def _fetch_from_url(self):
+        logger.info("Fetching content from: %s", self.url)
+        from .extract import extract
+        from .fetch import get_fetcher
+
+        self.extraction = extract(get_fetcher().fetch_text(self.url), self.extractor)
+        return self.extraction.text
+
+    def _fetch_from_rss(self):
+        from .feeds import feed_cache
+
+        try:
+            entry = feed_cache.entry(self.rss_feed_url, self.url)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read RSS feed %s: %s", self.rss_feed_url, e)
+            entry = None
+        if entry is not None:
+            return entry.summary
+        logger.warning("URL %s not found in RSS feed. Falling back to direct URL fetch.", self.url)
+        return self._fetch_from_url()
+
+
+def fetch_all(sources, concurrency=16, per_host=2, host_delay=0.5):
+    """Fetch and extract many Websites (or URLs) concurrently.
+
+    Yields a ``FetchResult(index, website, text, error)`` as each page
+    completes, so processing can start before the slowest page arrives. At
+    most ``per_host`` pages are fetched from one host at a time, started at
+    least ``host_delay`` seconds apart.
+    """
+    from .fetch import FetchResult, polite_map
+    from .feeds import feed_cache
+
+    websites = [source if isinstance(source, Website) else Website(source) for source in sources]
+    to_fetch = []
+    for index, website in enumerate(websites):
+        # Articles found in their (shared, cached) feed need no request and no politeness delay
+        if website.use_rss and website._text is None:
+            try:
+                entry = feed_cache.entry(website.rss_feed_url, website.url)
+            except (OSError, ValueError):
+                entry = None
+            if entry is not None:
+                website._text = entry.summary
+        if website._text is not None:
+            yield FetchResult(index, website, website._text, None)
+        else:
+            to_fetch.append(index)
+
+    results = polite_map(lambda website: website.text, [websites[index] for index in to_fetch],
+                         lambda website: website.url, concurrency, per_host, host_delay)
+    for result in results:
+        yield result._replace(index=to_fetch[result.index])
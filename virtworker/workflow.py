@@ -0,0 +1,251 @@
+"""Declarative workflow graphs.
+
+A ``Workflow`` is a set of named steps with data dependencies between them.
+``run()`` executes the graph in topological order, starting every step whose
+dependencies are finished as soon as a worker is free, so independent LLM
+calls overlap instead of waiting on each other.
+"""
+import contextvars
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+
+from . import trace
+from .scheduler import ModelScheduler, preload_model
+from .tokens import TokenUsage, track_usage
+
+logger = logging.getLogger(__name__)
+
+
+class WorkflowError(Exception):
+    def __init__(self, message, failed=None, results=None):
+        super().__init__(message)
+        self.failed = failed or {}
+        self.results = results or {}
+
+
+@dataclass
+class Step:
+    name: str
+    func: object
+    depends_on: tuple = ()
+    model: str = None
+    transport: object = None
+
+
+@dataclass
+class StepTiming:
+    name: str
+    ready: float = 0.0
+    start: float = 0.0
+    end: float = 0.0
+    usage: TokenUsage = field(default_factory=TokenUsage)
+
+    @property
+    def wait(self):
+        return self.start - self.ready
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+@dataclass
+class RunReport:
+    wall_time: float = 0.0
+    timings: dict = field(default_factory=dict)
+    usage: TokenUsage = field(default_factory=TokenUsage)
+    model_loads: int = 0
+    switches_avoided: int = 0
+
+    @property
+    def busy_time(self):
+        return sum(t.duration for t in self.timings.values())
+
+    @property
+    def speedup(self):
+        return self.busy_time / self.wall_time if self.wall_time else 0.0
+
+
+class Workflow:
+    def __init__(self, name="workflow", max_concurrency=4, max_loaded_models=None, keep_alive=None, preload=False):
+        """``max_loaded_models`` turns on model-aware scheduling and should
+        match ``OLLAMA_MAX_LOADED_MODELS``; ``keep_alive`` is how long Ollama
+        keeps an idle model loaded. With ``preload`` the first models the run
+        needs are loaded before any step starts."""
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_loaded_models = max_loaded_models
+        self.keep_alive = keep_alive
+        self.preload = preload
+        self.steps = {}
+        self.report = RunReport()
+
+    def add_step(self, name, func, depends_on=(), model=None, transport=None):
+        """Register ``func`` as a step.
+
+        ``func`` is called with the results of ``depends_on`` as positional
+        arguments, in the order they are listed. ``model`` names the model the
+        step calls, if any, for model-aware scheduling, and ``transport`` the
+        transport it is called through (the default transport when None), for
+        preloading.
+        """
+        if name in self.steps:
+            raise ValueError(f"Step '{name}' already exists in workflow '{self.name}'")
+        if isinstance(depends_on, str):
+            depends_on = (depends_on,)
+        self.steps[name] = Step(name, func, tuple(depends_on), model, transport)
+        return name
+
+    def add_node_step(self, name, node, prompt, depends_on=(), shared_context=False):
+        """Register a step that calls ``node``.
+
+        ``prompt`` is either a callable taking the dependency results, or a
+        string that is ``str.format``-ed with them as positional arguments.
+        Like ``Node.map``, the call gets a fresh, empty context, so steps that
+        share a node and run concurrently do not see each other's turns; with
+        ``shared_context`` it is the next turn of the node's conversation
+        instead. A failed call fails the step, so its dependents are skipped.
+        """
+        def run_node(*inputs):
+            text = prompt(*inputs) if callable(prompt) else prompt.format(*inputs)
+            if shared_context:
+                return node(text, raise_errors=True)
+            return node._generate(node._build_prompt(text, context=[]), getattr(node, 'max_tokens', 8192))
+        return self.add_step(name, run_node, depends_on, model=node.model_name, transport=node.transport)
+
+    @property
+    def models(self):
+        return sorted({step.model for step in self.steps.values() if step.model})
+
+    def _preload(self, ready):
+        steps = [self.steps[name] for name in ready if self.steps[name].model]
+        counts = Counter(step.model for step in steps)
+        for model, _ in counts.most_common(self.max_loaded_models or 1):
+            # Load it on every server that the steps using it talk to
+            transports = {id(step.transport): step.transport for step in steps if step.model == model}
+            for transport in transports.values():
+                preload_model(model, self.keep_alive, transport)
+
+    def _check_graph(self):
+        for step in self.steps.values():
+            for dep in step.depends_on:
+                if dep not in self.steps:
+                    raise ValueError(f"Step '{step.name}' depends on unknown step '{dep}'")
+
+        # Kahn's algorithm; anything left over is part of a cycle
+        remaining = {name: len(step.depends_on) for name, step in self.steps.items()}
+        dependents = self._dependents()
+        ready = [name for name, count in remaining.items() if count == 0]
+        visited = 0
+        while ready:
+            name = ready.pop()
+            visited += 1
+            for child in dependents[name]:
+                remaining[child] -= 1
+                if remaining[child] == 0:
+                    ready.append(child)
+        if visited != len(self.steps):
+            cyclic = sorted(name for name, count in remaining.items() if count > 0)
+            raise ValueError(f"Workflow '{self.name}' has a dependency cycle involving: {', '.join(cyclic)}")
+
+    def _dependents(self):
+        dependents = {name: [] for name in self.steps}
+        for step in self.steps.values():
+            for dep in step.depends_on:
+                dependents[dep].append(step.name)
+        return dependents
+
+    def _run_step(self, step, inputs, timing):
+        timing.start = time.perf_counter()
+        try:
+            with trace.span(step.name, "step", model=step.model, depends_on=list(step.depends_on),
+                            queue_wait=timing.wait), track_usage(timing.usage):
+                return step.func(*inputs)
+        finally:
+            timing.end = time.perf_counter()
+
+    def run(self):
+        """Execute the workflow and return a dict of step name to result."""
+        self._check_graph()
+        dependents = self._dependents()
+        waiting_on = {name: set(step.depends_on) for name, step in self.steps.items()}
+        results = {}
+        failed = {}
+        self.report = RunReport()
+        run_start = time.perf_counter()
+
+        scheduler = ModelScheduler(self.max_loaded_models, self.keep_alive) if self.max_loaded_models else None
+        running_models = Counter()
+
+        ready = [name for name, deps in waiting_on.items() if not deps]
+        for name in ready:
+            self.report.timings[name] = StepTiming(name, ready=run_start)
+            if scheduler:
+                scheduler.note_ready(self.steps[name].model)
+        if self.preload:
+            self._preload(ready)
+
+        logger.info("[%s] Running %d steps with up to %d in parallel", self.name, len(self.steps), self.max_concurrency)
+        with trace.span(self.name, "workflow", steps=len(self.steps)), \
+                ThreadPoolExecutor(max_workers=self.max_concurrency) as executor, track_usage(self.report.usage):
+            running = {}
+            while ready or running:
+                while ready and len(running) < self.max_concurrency:
+                    if scheduler:
+                        index = scheduler.pick(ready, lambda n: self.steps[n].model, running_models)
+                        if index is None:
+                            break
+                    else:
+                        index = 0
+                    name = ready.pop(index)
+                    step = self.steps[name]
+                    if scheduler:
+                        scheduler.note_start(step.model)
+                    running_models[step.model] += 1
+                    inputs = [results[dep] for dep in step.depends_on]
+                    future = executor.submit(contextvars.copy_context().run,
+                                             self._run_step, step, inputs, self.report.timings[name])
+                    running[future] = name
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    running_models[self.steps[name].model] -= 1
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        failed[name] = e
+                        logger.error("[%s] Step '%s' failed: %s", self.name, name, e)
+                        continue
+                    for child in dependents[name]:
+                        waiting_on[child].discard(name)
+                        if not waiting_on[child]:
+                            ready.append(child)
+                            self.report.timings[child] = StepTiming(child, ready=time.perf_counter())
+                            if scheduler:
+                                scheduler.note_ready(self.steps[child].model)
+
+        self.report.wall_time = time.perf_counter() - run_start
+        logger.info("[%s] Finished in %.2fs (%.2fs of step time, %.1fx parallelism, "
+                    "%d prompt / %d completion tokens)", self.name, self.report.wall_time, self.report.busy_time,
+                    self.report.speedup, self.report.usage.prompt_tokens, self.report.usage.completion_tokens)
+        if scheduler:
+            self.report.model_loads = scheduler.loads
+            self.report.switches_avoided = scheduler.switches_avoided
+            logger.info("[%s] %d model loads, %d switches avoided by model-aware scheduling",
+                        self.name, scheduler.loads, self.report.switches_avoided)
+
+        if failed:
+            skipped = len(self.steps) - len(results) - len(failed)
+            raise WorkflowError(
+                f"Workflow '{self.name}': {len(failed)} step(s) failed, {skipped} skipped",
+                failed=failed, results=results)
+        return results
+
+    def print_timings(self):
+        for timing in sorted(self.report.timings.values(), key=lambda t: t.start):
+            print(f"{timing.name:<40} wait {timing.wait:7.2f}s  run {timing.duration:7.2f}s  "
+                  f"tokens {timing.usage.prompt_tokens:>7} in {timing.usage.completion_tokens:>6} out")
@@ -1,8 +1,8 @@
 import os
 import sys
 import json
-import time
 import torch
+import zmq
 from melo.api import TTS
 
 # Add the necessary directories to the Python path
@@ -32,50 +32,61 @@ def run_voice_service():
     # Get the 'en-au' speaker ID
     speaker_id = tts_model.hps.data.spk2id['en_au'] if 'en_au' in tts_model.hps.data.spk2id else 0
 
-    request_dir = 'tts_requests'
+    # Both are the same for every request, so compute them once
+    reference_speaker = os.path.join(current_dir, 'resources', 'example_reference.wav')
+    target_se, _ = se_extractor.get_se(reference_speaker, tone_color_converter, vad=False)
+    source_se = torch.load(os.path.join(current_dir, 'checkpoints_v2', 'checkpoints_v2', 'base_speakers', 'ses', 'en-au.pth'), map_location=device)
+
     output_dir = 'tts_output'
-    os.makedirs(request_dir, exist_ok=True)
     os.makedirs(output_dir, exist_ok=True)
 
+    # Requests arrive on a ZeroMQ reply socket; recv blocks until one does, so there is no polling delay
+    endpoint = os.environ.get("VIRTWORKER_TTS_ENDPOINT") or "tcp://127.0.0.1:5556"
+    socket = zmq.Context.instance().socket(zmq.REP)
+    socket.bind(endpoint)
+    print(f"Listening for TTS requests on {endpoint}")
+
     while True:
-        # Check for TTS requests
-        for filename in os.listdir(request_dir):
-            if filename.endswith('.json'):
-                request_path = os.path.join(request_dir, filename)
-                with open(request_path, 'r') as f:
-                    request = json.load(f)
-                
-                text = request['text']
-                output_filename = request['output_filename']
-                
-                print(f"Processing TTS request: {text[:50]}...")
-                
-                # Generate initial audio
-                tmp_path = os.path.join(output_dir, 'tmp.wav')
-                tts_model.tts_to_file(text, speaker_id, tmp_path)
-
-                # Apply voice conversion
-                output_path = os.path.join(output_dir, output_filename)
-                reference_speaker = os.path.join(current_dir, 'resources', 'example_reference.wav')
-                target_se, _ = se_extractor.get_se(reference_speaker, tone_color_converter, vad=False)
-                source_se = torch.load(os.path.join(current_dir, 'checkpoints_v2', 'checkpoints_v2', 'base_speakers', 'ses', 'en-au.pth'), map_location=device)
-
-                tone_color_converter.convert(
-                    audio_src_path=tmp_path,
-                    src_se=source_se,
-                    tgt_se=target_se,
-                    output_path=output_path
-                )
-                
-                # Remove temporary file
-                os.remove(tmp_path)
-                
-                print(f"TTS output saved to {output_path}")
-                
-                # Remove the processed request
-                os.remove(request_path)
-        
-        time.sleep(1)  # Check for new requests every second
+        frames = socket.recv_multipart()
+        # Everything after recv is inside the try: a REP socket must reply before it can receive again
+        try:
+            request = json.loads(frames[0])
+            text = request['text']
+            output_filename = request['output_filename']
+
+            print(f"Processing TTS request: {text[:50]}...")
+
+            # Generate initial audio
+            tmp_path = os.path.join(output_dir, 'tmp.wav')
+            tts_model.tts_to_file(text, speaker_id, tmp_path)
+
+            # Apply voice conversion
+            output_path = os.path.join(output_dir, output_filename)
+            tone_color_converter.convert(
+                audio_src_path=tmp_path,
+                src_se=source_se,
+                tgt_se=target_se,
+                output_path=output_path
+            )
+
+            # Remove temporary file
+            os.remove(tmp_path)
+        except Exception as e:
+            print(f"TTS request failed: {str(e)}")
+            socket.send_multipart([json.dumps({"status": "error", "error": str(e)}).encode()])
+            continue
+
+        print(f"TTS output saved to {output_path}")
+
+        # Reply with the path, and the audio itself when asked for it
+        reply = [json.dumps({"status": "ok", "path": os.path.abspath(output_path)}).encode()]
+        try:
+            if request.get('return_audio'):
+                with open(output_path, 'rb') as f:
+                    reply.append(f.read())
+        except OSError as e:
+            reply = [json.dumps({"status": "error", "error": str(e)}).encode()]
+        socket.send_multipart(reply)
 
 if __name__ == "__main__":
     run_voice_service()